@@ -3,6 +3,7 @@ import csv
 from typing import List, Callable, Tuple, Mapping, Set, Dict, FrozenSet, Union
 from datetime import date
 from objects import *
+from conflict_graph import ConflictGraph
 import re
 
 
@@ -196,7 +197,16 @@ class CSVdataloader(Dataloader):
         """
         Return weight for course pair.
         """
-        return lambda c1, c2: self.course_pair_weight_calc(c1, c2)
+        return self.course_pair_weight_calc  # a bound method, unlike a lambda, can be sent to worker processes
+
+    def get_conflict_graph(self) -> ConflictGraph:
+        """
+        Return the sparse conflict graph of the courses, built straight from the collisions found while parsing
+        instead of checking every pair of courses.
+        """
+        if self._conflict_graph is None:
+            self._conflict_graph = ConflictGraph(self.get_course_list(), self.__course_pairs)
+        return self._conflict_graph
 
     def get_available_dates(self) -> Tuple[List[date], List[date]]:
         """
@@ -5,9 +5,11 @@ from solver import *
 from dataloader import Dataloader
 from objects import Course
 from state import Evaluator, State
+from penalty_kernel import PenaltyKernel, TRUNCATED
 
 MAX_DATE_DIFF = 10  # maximum amount of days between tests that we let courses effect each other
 MAX_PENALTY = 1.0  # maximum penalty allowed between two courses.
+DATE_DIFF_KERNEL = PenaltyKernel(shape=TRUNCATED, cutoff=MAX_DATE_DIFF - 1)
 
 
 class CSstate(State):
@@ -42,14 +44,17 @@ class CSsolver(Solver):
     def __init__(self, loader: Dataloader, evaluator: Evaluator):
         super(CSsolver, self).__init__(loader, evaluator)
         self.solutions = set()
+        self._deadline = Deadline()
 
-    def solve(self) -> Set[State]:
+    def solve(self, time_limit: float = None) -> Set[State]:
         """
             Builds all possible schedules matching hard constraints.
                 The hard constraints are: - 21 days in between tests
                                           - if the penalty between two tests of some two courses on some two dates
                                             is more then MAX_PENALTY (defined above)
+            If time_limit is given, the search stops after time_limit seconds and returns the schedules found so far.
         """
+        self._deadline = Deadline(time_limit)
         courses_by_points = self._get_top_10({course: course.course_points for course in self.course_list},
                                              reverse=False)
         empty_state = CSstate(course_list=self.course_list, date_list=self.dates, keep_empty=True)
@@ -91,13 +96,15 @@ class CSsolver(Solver):
         :return: Float symbolizing the strain on the schedule by adding tests of this subject on these dates.
         """
         penalty = .0
+        new_days = [new_date.toordinal() for new_date in new_dates]
         for course2compare in courses_included:
             for date2compare in state.courses_dict[course2compare]:
-                for new_date in new_dates:
-                    dates_diff = abs(date2compare - new_date) # check both if moedA of one is close to moedB of other
-                    if dates_diff < MAX_DATE_DIFF:
-                        cur_penalty = 1/dates_diff * self.course_pair_evaluator((new_course, course2compare))
-                        penalty += cur_penalty if cur_penalty < MAX_PENALTY else 0
+                day2compare = date2compare.toordinal()
+                for new_day in new_days:
+                    # check both if moedA of one is close to moedB of other, the kernel is 0 from MAX_DATE_DIFF days
+                    cur_penalty = DATE_DIFF_KERNEL[day2compare - new_day] * \
+                                  self.course_pair_evaluator((new_course, course2compare))
+                    penalty += cur_penalty if cur_penalty < MAX_PENALTY else 0
         return penalty
 
     def _get_top_10(self, some_dict: dict, reverse=True):
@@ -141,6 +148,8 @@ class CSsolver(Solver):
         if state.is_pos_goal_state():
             self.solutions.add(state)
             return
+        if self._deadline.expired():
+            return
         for course2add in self._get_top_10(courses_not_included):
             new_courses_not_included = self._update_course_penalties(course2add, courses_not_included)
             courses_included.add(course2add)
@@ -0,0 +1,145 @@
+import os
+import random
+from array import array
+from datetime import date
+from itertools import count
+from math import exp
+from typing import Tuple, Sequence
+
+from solver import *
+from dataloader import Dataloader
+from progress import spawn_pool, set_worker_context, worker_context
+from state import Evaluator, State, ArrayState
+from SAsolver import SAstate, GENERATORS, SUB_GROUP_N, DEFAULT_T0, ITERATION_N
+
+PT_T_MIN = 1
+PT_T_MAX = DEFAULT_T0
+SWAP_EVERY = 200
+
+
+def _run_replica(days: Tuple[array, array], penalty: float, T: float, steps: int, seed: int) \
+        -> Tuple[Tuple[array, array], float, Tuple[array, array], float, int]:
+    """
+    Run steps Metropolis steps at the fixed temperature T on a replica, in a worker process. States are sent both
+    ways as their (moed a, moed b) int16 day arrays, and rebuilt with the worker's courses and calendar. The worker
+    context is the problem instance PTsolver.solve starts the pool with.
+    :return: Tuple of the replica's new days and penalty, the days and penalty of the best state it passed through
+    and the number of accepted moves.
+    """
+    evaluator, bounds, dates_possible, courses, calendar, conflict_graph = worker_context()
+    random.seed(seed)
+    state = ArrayState(courses, calendar, *days)
+    sa_state = SAstate(bounds=bounds, courses_and_dates=state.courses_dict, dates_possible=dates_possible,
+                       conflict_graph=conflict_graph)
+    best, best_pen = days, penalty
+    accepted = 0
+    for _ in range(steps):
+        journal = sa_state.get_successor(random.choice(SUB_GROUP_N), random.choice(GENERATORS))
+        diff = evaluator.delta(sa_state, journal)
+        if diff <= 0 or random.uniform(0, 1) < exp(-diff / T):
+            penalty += diff
+            accepted += 1
+            if penalty < best_pen:
+                best_state, best_pen = ArrayState.from_state(sa_state, courses, calendar), penalty
+                best = best_state.moed_a, best_state.moed_b
+        else:
+            sa_state.undo(journal)
+    state = ArrayState.from_state(sa_state, courses, calendar)
+    return (state.moed_a, state.moed_b), penalty, best, best_pen, accepted
+
+
+class PTsolver(Solver):
+    """
+        Replica exchange (parallel tempering) solver. Several replicas of the schedule are annealed at a ladder of
+    fixed temperatures, each in a worker process, and every few steps neighboring temperatures swap their states with
+    the Metropolis probability. Hot replicas explore while cold ones refine, so there is no cooling schedule to tune.
+    """
+
+    def __init__(self, loader: Dataloader, evaluator: Evaluator,
+                 bounds: Tuple[Tuple[date, date], Tuple[date, date]], temperatures: Sequence[float] = None):
+        """
+        :param bounds: Date bounds of moed a and moed b, as in SAsolver.
+        :param temperatures: Temperature of every replica. default: one replica per core (at least 4), spaced
+        geometrically from PT_T_MIN to PT_T_MAX.
+        """
+        super(PTsolver, self).__init__(loader, evaluator)
+        self.bounds = bounds
+        self.dates = loader.get_available_dates()
+        if temperatures is None:
+            n = max(os.cpu_count(), 4)
+            temperatures = [PT_T_MIN * (PT_T_MAX / PT_T_MIN) ** (i / (n - 1)) for i in range(n)]
+        self.temperatures = sorted(temperatures)
+        self.swap_rate = 0  # fraction of swaps accepted in the last solve
+        self.acceptance_rates = [0] * len(self.temperatures)  # fraction of moves accepted at every temperature
+
+    def solve(self, progress_func: Callable, iterations=ITERATION_N, swap_every=SWAP_EVERY, workers=None,
+              time_limit: float = None) -> State:
+        """
+            Run the replicas and return the best state any of them reached.
+        :param iterations: Number of Metropolis steps every replica makes.
+        :param swap_every: Number of steps between two rounds of swaps.
+        :param workers: Number of worker processes. 0 runs all replicas in this process.
+        default: one per core, at most one per replica
+        :param time_limit: If given, run rounds of swap_every steps until time_limit seconds pass, instead of for
+        the given number of iterations.
+        """
+        deadline = Deadline(time_limit)
+        courses = self.conflict_graph.courses
+        replicas = []
+        dates_possible = None
+        for _ in self.temperatures:
+            state = SAstate(bounds=self.bounds, course_list=self.course_list, date_list=self.dates,
+                            dates_possible=dates_possible)
+            dates_possible = state.dates_possible
+            replicas.append((ArrayState.from_state(state, courses, self.calendar), self.evaluator(state)))
+        best, best_pen = min(replicas, key=lambda replica: replica[1])
+        problem = (self.evaluator, self.bounds, dates_possible, courses, self.calendar, self.conflict_graph)
+
+        if workers is None:
+            workers = min(len(self.temperatures), os.cpu_count())
+        pool = None
+        if workers:
+            pool = spawn_pool(workers, problem)
+        else:
+            set_worker_context(problem)
+
+        rounds = max(iterations // swap_every, 1)
+        rounds_done, swaps_tried, swaps_done = 0, 0, 0
+        accepted_moves = [0] * len(self.temperatures)
+        try:
+            for r in count():
+                if (time_limit is None and r >= rounds) or (r and deadline.expired()):
+                    break
+                progress_func(r / rounds if time_limit is None else deadline.fraction())
+                tasks = [((state.moed_a, state.moed_b), pen, T, swap_every, random.randrange(2 ** 32))
+                         for (state, pen), T in zip(replicas, self.temperatures)]
+                if pool:
+                    results = list(pool.map(_run_replica, *zip(*tasks)))
+                else:  # replicas reseed random, keep the swaps' random sequence as it is with workers
+                    random_state = random.getstate()
+                    results = [_run_replica(*task) for task in tasks]
+                    random.setstate(random_state)
+
+                rounds_done += 1
+                replicas = [(ArrayState(courses, self.calendar, *days), pen) for days, pen, _, _, _ in results]
+                for i, (_, _, _, _, accepted) in enumerate(results):
+                    accepted_moves[i] += accepted
+                for _, _, replica_best, replica_best_pen, _ in results:
+                    if replica_best_pen < best_pen:
+                        best, best_pen = ArrayState(courses, self.calendar, *replica_best), replica_best_pen
+
+                # swap neighboring temperatures, alternating between even and odd pairs
+                for i in range(r % 2, len(replicas) - 1, 2):
+                    swaps_tried += 1
+                    power = (replicas[i][1] - replicas[i + 1][1]) * \
+                            (1 / self.temperatures[i] - 1 / self.temperatures[i + 1])
+                    if power >= 0 or random.uniform(0, 1) < exp(power):
+                        replicas[i], replicas[i + 1] = replicas[i + 1], replicas[i]
+                        swaps_done += 1
+        finally:
+            if pool:
+                pool.shutdown()
+
+        self.swap_rate = swaps_done / swaps_tried if swaps_tried else 0
+        self.acceptance_rates = [accepted / (rounds_done * swap_every) for accepted in accepted_moves]
+        return best.to_state()
@@ -2,7 +2,8 @@ import matplotlib.pyplot as plt
 from tqdm import tqdm
 
 from CSVdataloader import CSVdataloader
-from SAsolver import SAsolver
+from SAsolver import SAsolver, LINEAR_SCHEDULE, ADAPTIVE_SCHEDULE
+from PTsolver import PTsolver
 from state import *
 
 
@@ -85,11 +86,49 @@ def re_best_changes(s, e):
     plt.show()
 
 
+def tempering_changes(s, e, dl, bounds):
+    """
+    Compare annealing to replica exchange for the same total number of evaluated moves.
+    """
+    evaluations = [4000, 8000, 16000, 32000]
+    sa_penalties, pt_penalties = [], []
+    pt_solver = PTsolver(dl, e, bounds)
+
+    for n in tqdm(evaluations):
+        sa_penalties.append(e.evaluate(s.solve(func, iterations=n)))
+        pt_penalties.append(e.evaluate(pt_solver.solve(func, iterations=n // len(pt_solver.temperatures))))
+    plt.plot(evaluations, sa_penalties, 'b', label='Simulated Annealing')
+    plt.plot(evaluations, pt_penalties, 'g', label='Replica Exchange')
+    plt.xlabel('Evaluated Moves')
+    plt.ylabel('Penalties')
+    plt.yscale('log')
+    plt.legend()
+    plt.show()
+
+
+def schedule_changes(s, e):
+    """
+    Compare the fixed cooling schedule to the adaptive one, by penalty and by the number of iterations actually run.
+    """
+    iters = [1000, 2000, 5000, 7000, 10_000]
+    for schedule, color in [(LINEAR_SCHEDULE, 'b'), (ADAPTIVE_SCHEDULE, 'r')]:
+        penalties, iterations_run = [], []
+        for i in tqdm(iters):
+            penalties.append(e.evaluate(s.solve(func, iterations=i, schedule=schedule)))
+            iterations_run.append(s.iterations_run)
+        plt.plot(iterations_run, penalties, color, marker='o', label=schedule)
+    plt.xlabel('Iterations Run')
+    plt.ylabel('Penalties')
+    plt.yscale('log')
+    plt.legend()
+    plt.show()
+
+
 def main():
     dl = CSVdataloader("data/data2.csv", "data/courses_names_A.csv", date(2021, 1, 16), date(2021, 2, 11),
                        date(2021, 2, 13),
                        date(2021, 3, 4), [], YearSemester.SEM_A)
-    evaluator = SumEvaluator(dl.get_course_pair_weights())
+    evaluator = SumEvaluator(dl.get_course_pair_weights(), dl.get_conflict_graph())
 
     solver = SAsolver(dl, evaluator, ((date(2021, 1, 16), date(2021, 2, 11)), (date(2021, 2, 13),
                                                                                date(2021, 3, 4))))
@@ -104,6 +143,11 @@ def main():
 
 #     re_best_changes(solver, evaluator)
 
+#     schedule_changes(solver, evaluator)
+
+#     tempering_changes(solver, evaluator, dl, ((date(2021, 1, 16), date(2021, 2, 11)),
+#                                               (date(2021, 2, 13), date(2021, 3, 4))))
+
 
 if __name__ == '__main__':
     main()
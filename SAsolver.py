@@ -1,9 +1,17 @@
-import copy
+import os
+import random
+import time
 from datetime import date, timedelta
-from typing import List, Set, Dict, Tuple, Iterable, Sequence
+from functools import lru_cache
+from itertools import count
+from typing import List, Set, Dict, Tuple, Iterable, Sequence, NamedTuple, FrozenSet
 from solver import *
 from dataloader import Dataloader
 from objects import Course
+from conflict_graph import ConflictGraph
+from checkpoint import Checkpointer
+from progress import QueueProgress, wait_with_progress, spawn_pool_with_progress, worker_context
+from sampling import FenwickSampler
 from state import Evaluator, State
 from random import sample, choice, uniform
 from math import exp
@@ -12,11 +20,97 @@ from math import exp
 SWAP_GENERATOR = "SWAP"
 MOVE_ONE_GENERATOR = "MOVE_ONE"
 MOVE_TWO_GENERATOR = "MOVE_TWO"
-GENERATORS = [SWAP_GENERATOR, MOVE_TWO_GENERATOR, MOVE_ONE_GENERATOR]
+KEMPE_GENERATOR = "KEMPE"
+DAY_SWAP_GENERATOR = "DAY_SWAP"
+GENERATORS = [SWAP_GENERATOR, MOVE_TWO_GENERATOR, MOVE_ONE_GENERATOR, KEMPE_GENERATOR, DAY_SWAP_GENERATOR]
 DEFAULT_T0 = 1200
+WARM_T0 = 50  # default initial temperature of a run that starts from a given schedule, reheats it only a little
 ITERATION_N = 7000
 SUB_GROUP_N = [1, 2, 3]
+MOVE_TABLES_CACHE = 8
+DIRECTED_FLOOR = 0.5  # share of the mean course penalty every course keeps in directed sampling
 
+LINEAR_SCHEDULE = "linear"
+ADAPTIVE_SCHEDULE = "adaptive"
+SCHEDULES = [LINEAR_SCHEDULE, ADAPTIVE_SCHEDULE]
+ACCEPT_WINDOW = 100  # moves between two temperature updates of the adaptive schedule
+ACCEPT_START = 0.1  # target ratio of accepted uphill moves of the adaptive schedule at the first iteration
+ACCEPT_END = 0.002  # target ratio of accepted uphill moves of the adaptive schedule at the last iteration
+ADAPT_GAIN = 0.5  # how hard the adaptive schedule pulls the temperature towards the target ratio
+PLATEAU_PER = 0.2  # the adaptive schedule stops once the best penalty has not improved for this share of iterations
+PLATEAU_TOL = 1e-4  # smallest relative improvement of the best penalty that ends a plateau
+TIME_CHECK_EVERY = 100  # iterations between two checks of the clock of a time limited run
+HOT_STAGE_PER = 1 / 7  # share of a time limited run the first stage of LINEAR_SCHEDULE takes, as 1000 of ITERATION_N
+
+
+class MoveTables:
+    """
+        Precomputed legal moves of MOVE_ONE_GENERATOR and MOVE_TWO_GENERATOR. For a course with dates (a, b), the
+    tables hold every (a', b') the generator may move it to - a day forwards or backwards, in bounds, on a possible date
+    and at least MIN_DAYS_FROM_A_TO_B days apart - so a move is drawn in constant time instead of retrying random
+    directions. The pairs of all possible dates are built up front, any other pair the first time it is seen.
+    Tables are shared by all states of the same bounds and possible dates, see get_move_tables.
+    """
+
+    def __init__(self, bounds: Tuple[Tuple[date, date], Tuple[date, date]], dates_possible: Set[date]):
+        self.bounds = bounds
+        self.dates_possible = dates_possible
+        self._move_one: Dict[Tuple[date, date], List[Tuple[date, date]]] = dict()
+        self._move_two: Dict[Tuple[date, date], List[Tuple[date, date]]] = dict()
+        moed_a_dates = sorted(d for d in dates_possible if self._legal(d, 0))
+        moed_b_dates = sorted(d for d in dates_possible if self._legal(d, 1))
+        self.dates: Tuple[List[date], List[date]] = moed_a_dates, moed_b_dates  # legal dates of every moed
+        for a_date in moed_a_dates:
+            for b_date in moed_b_dates:
+                self._build((a_date, b_date))
+
+    def move_one(self, dates: Tuple[date, date]) -> List[Tuple[date, date]]:
+        """
+            Returns the dates a MOVE_ONE_GENERATOR move can take a course with the given dates to.
+        """
+        if dates not in self._move_one:
+            self._build(dates)
+        return self._move_one[dates]
+
+    def move_two(self, dates: Tuple[date, date]) -> List[Tuple[date, date]]:
+        """
+            Returns the dates a MOVE_TWO_GENERATOR move can take a course with the given dates to.
+        """
+        if dates not in self._move_two:
+            self._build(dates)
+        return self._move_two[dates]
+
+    def _legal(self, new_date: date, moed: int) -> bool:
+        return self.bounds[moed][0] <= new_date <= self.bounds[moed][1] and new_date in self.dates_possible
+
+    def _build(self, dates: Tuple[date, date]):
+        one_day = timedelta(days=1)
+        gap = timedelta(days=MIN_DAYS_FROM_A_TO_B)
+        move_one, move_two = [], []
+        for direction in [-one_day, one_day]:
+            new_a, new_b = dates[0] + direction, dates[1] + direction
+            if self._legal(new_a, 0) and self._legal(new_b, 1) and new_b - new_a >= gap:
+                move_two.append((new_a, new_b))
+            if self._legal(new_a, 0) and dates[1] - new_a >= gap:
+                move_one.append((new_a, dates[1]))
+            if self._legal(new_b, 1) and new_b - dates[0] >= gap:
+                move_one.append((dates[0], new_b))
+        self._move_one[dates] = move_one
+        self._move_two[dates] = move_two
+
+
+@lru_cache(maxsize=MOVE_TABLES_CACHE)
+def _cached_move_tables(bounds: Tuple[Tuple[date, date], Tuple[date, date]],
+                        dates_possible: FrozenSet[date]) -> MoveTables:
+    return MoveTables(bounds, set(dates_possible))
+
+
+def get_move_tables(bounds: Tuple[Tuple[date, date], Tuple[date, date]], dates_possible: Set[date]) -> MoveTables:
+    """
+        Returns the move tables of the given bounds and possible dates. Tables are cached by their content, so when
+    the possible dates change (for example when dates are forbidden in the GUI), new tables are built.
+    """
+    return _cached_move_tables(bounds, frozenset(dates_possible))
 
 
 class SAstate(State):
@@ -25,7 +119,11 @@ class SAstate(State):
                  courses_and_dates: Dict[Course, Tuple[date, date]] = None,
                  course_list: Iterable[Course] = None,
                  date_list: Tuple[Sequence[date], Sequence[date]] = None,
-                 dates_possible: Set[date] = None):
+                 dates_possible: Set[date] = None, move_tables: MoveTables = None,
+                 conflict_graph: ConflictGraph = None):
+        """
+        :param conflict_graph: Conflict graph of the courses, needed by KEMPE_GENERATOR.
+        """
         super(SAstate, self).__init__(courses_and_dates, course_list, date_list)
         self.course_list = [c for c in self.courses_dict.keys()]
         self.date_list = date_list
@@ -36,6 +134,13 @@ class SAstate(State):
 
         else:
             self.dates_possible = dates_possible
+        if move_tables is None or move_tables.bounds != bounds or move_tables.dates_possible != self.dates_possible:
+            move_tables = get_move_tables(bounds, self.dates_possible)
+        self.move_tables = move_tables
+        self.conflict_graph = conflict_graph
+        self.moved: Dict[Course, Tuple[date, date]] = dict()
+        # moed -> date -> courses with their moed exam on it (dicts keep a deterministic order), built on first use
+        self._buckets: Tuple[Dict[date, Dict[Course, None]], Dict[date, Dict[Course, None]]] = None
 
     def build_poss_dates(self):
         """
@@ -48,66 +153,152 @@ class SAstate(State):
                 self.dates_possible.add(date2add)
 
 
-    def get_successor(self, sub_group_n: int, generator: str):
+    def copy(self):
+        """
+            Returns a new state with a copy of this state's dates.
+        """
+        return SAstate(bounds=self.bounds, courses_and_dates=dict(self.courses_dict),
+                       dates_possible=self.dates_possible, move_tables=self.move_tables,
+                       conflict_graph=self.conflict_graph)
+
+    def get_successor(self, sub_group_n: int, generator: str, courses2move: Sequence[Course] = None):
         """
             Creates successor by effecting (len(course_list) choose sub_group_n) courses through generator action
-        type.
+        type. If courses2move is given, those courses are moved instead of a uniformly drawn subgroup.
             Generator types:
                 SWAP_GENERATOR - swaps courses test dates with a randomly chosen other course
                 MOVE_TWO_GENERATOR - moves both courses test dates a day forwards or a day backwards if allowed
                 MOVE_ONE_GENERATOR - moves one of a courses test dates a day forwards or a day backwards
+                KEMPE_GENERATOR - swaps the course's date of one moed with another date, along with the Kempe chain
+            of the course (see swap_days)
+                DAY_SWAP_GENERATOR - swaps all of the exams of one moed on the course's date with those of another date
+            Legal day moves are drawn from the precomputed move tables, a course with no legal move stays in place.
+            The moves are applied in place. The original dates of every course touched are kept in a journal,
+        self.moved, which is also returned - it gives the moved courses for incremental evaluation, and undo(journal)
+        rolls the move back in O(k).
         """
-        orig_state = SAstate(bounds=self.bounds,
-                             courses_and_dates={c: self.courses_dict[c] for c in self.courses_dict},
-                             dates_possible=self.dates_possible)
-        courses2move = sample(self.course_list, sub_group_n)
+        self.moved = dict()
+        if courses2move is None:
+            courses2move = sample(self.course_list, sub_group_n)
         for course in courses2move:
+            self.moved.setdefault(course, self.courses_dict[course])
 
             # swaps both moed dates between two courses
             if generator == SWAP_GENERATOR:
                 course2swap = choice(self.course_list)
+                self.moved.setdefault(course2swap, self.courses_dict[course2swap])
                 dates2save = self.courses_dict[course]
-                self.courses_dict[course] = self.courses_dict[course2swap]
-                self.courses_dict[course2swap] = dates2save
+                self._set_dates(course, self.courses_dict[course2swap])
+                self._set_dates(course2swap, dates2save)
 
             # moves both of the moeds of the given course a day forwards or backwards
             elif generator == MOVE_TWO_GENERATOR:
-                i = 0
-                new_dates = 0
-                while i < 100:
-                    direction = choice([-1, 1])
-                    dates = self.courses_dict[course]
-                    new_dates = dates[0] + timedelta(days=direction), dates[1] + timedelta(days=direction)
-                    if self.bounds[0][0] <= new_dates[0] <= self.bounds[0][1] and \
-                            self.bounds[1][0] <= new_dates[1] <= self.bounds[1][1] and new_dates[1] - new_dates[
-                        0] >= timedelta(days=21) and \
-                        new_dates[0] in self.dates_possible and new_dates[1] in self.dates_possible:
-                        break
-                    i += 1
-                if i < 100:
-                    self.courses_dict[course] = new_dates
+                new_dates = self.move_tables.move_two(self.courses_dict[course])
+                if new_dates:
+                    self._set_dates(course, choice(new_dates))
 
             # moves one of the moeds of the given course a day forwards or backwards
             elif generator == MOVE_ONE_GENERATOR:
-                i = 0
-                new_dates = 0
-                dates = self.courses_dict[course]
-                while i < 100:
-                    direction = choice([-1, 1])
-                    moed = choice([0, 1])
-                    new_date = dates[moed] + timedelta(days=direction)
-                    if moed == 0:
-                        new_dates = (new_date, dates[1])
-                    else:
-                        new_dates = (dates[0], new_date)
-                    if self.bounds[moed][0] <= new_date <= self.bounds[moed][1] and new_dates[1] - new_dates[
-                        0] >= timedelta(days=21) and new_date in self.dates_possible:
-                        break
-                    i += 1
-                if i < 100:
-                    self.courses_dict[course] = new_dates
-
-        return orig_state
+                new_dates = self.move_tables.move_one(self.courses_dict[course])
+                if new_dates:
+                    self._set_dates(course, choice(new_dates))
+
+            # swaps two dates of a moed, for the course's chain of conflicts or for every course on them
+            elif generator in (KEMPE_GENERATOR, DAY_SWAP_GENERATOR):
+                moed = choice([0, 1])
+                self.swap_days(course, moed, choice(self.move_tables.dates[moed]),
+                               whole_days=generator == DAY_SWAP_GENERATOR)
+
+        return self.moved
+
+    def swap_days(self, course: Course, moed: int, other_date: date, whole_days: bool = False):
+        """
+            Swaps the moed exams on the course's date with those on other_date - all of them if whole_days, otherwise
+        only the Kempe chain of the course: the courses reachable from it through conflicts between the two dates,
+        which are found through the date buckets, without scanning all courses. Nothing changes if one of the courses
+        would end up less than MIN_DAYS_FROM_A_TO_B days from its other exam. The moved courses are added to the
+        journal, self.moved.
+        """
+        buckets = self._get_buckets()[moed]
+        course_date = self.courses_dict[course][moed]
+        if other_date == course_date:
+            return
+        swapped = {course_date: other_date, other_date: course_date}
+
+        if whole_days:
+            chain = list(buckets.get(course_date, ())) + list(buckets.get(other_date, ()))
+        else:
+            if self.conflict_graph is None:
+                raise ValueError("Kempe chain moves need the conflict graph of the courses")
+            graph = self.conflict_graph
+            chain, in_chain = [course], {course}
+            for member in chain:  # grows while it is walked
+                conflicting = buckets.get(swapped[self.courses_dict[member][moed]], ())
+                for j, _ in graph.neighbours(graph.index[member]):
+                    other = graph.courses[j]
+                    if other in conflicting and other not in in_chain:
+                        chain.append(other)
+                        in_chain.add(other)
+
+        gap = timedelta(days=MIN_DAYS_FROM_A_TO_B)
+        new_dates = []
+        for member in chain:
+            dates = list(self.courses_dict[member])
+            dates[moed] = swapped[dates[moed]]
+            if dates[1] - dates[0] < gap:
+                return
+            new_dates.append((member, tuple(dates)))
+        for member, dates in new_dates:
+            self.moved.setdefault(member, self.courses_dict[member])
+            self._set_dates(member, dates)
+
+    def undo(self, journal: Dict[Course, Tuple[date, date]]):
+        """
+            Rolls back a move, given the journal get_successor returned for it.
+        """
+        for course, dates in journal.items():
+            self._set_dates(course, dates)
+
+    def _set_dates(self, course: Course, dates: Tuple[date, date]):
+        if self._buckets is not None:
+            old_dates = self.courses_dict[course]
+            for moed in (0, 1):
+                if old_dates[moed] != dates[moed]:
+                    del self._buckets[moed][old_dates[moed]][course]
+                    self._buckets[moed].setdefault(dates[moed], dict())[course] = None
+        self.courses_dict[course] = dates
+
+    def _get_buckets(self) -> Tuple[Dict[date, Dict[Course, None]], Dict[date, Dict[Course, None]]]:
+        if self._buckets is None:
+            self._buckets = dict(), dict()
+            for course, dates in self.courses_dict.items():
+                for moed in (0, 1):
+                    self._buckets[moed].setdefault(dates[moed], dict())[course] = None
+        return self._buckets
+
+
+class ChainStats(NamedTuple):
+    """
+    Statistics of a single annealing chain of SAsolver.solve_multi_start.
+    """
+    seed: int
+    initial_penalty: float
+    penalty: float
+    seconds: float
+
+
+def _run_chain(queue, chain_index: int, seed: int, solve_kwargs: dict) -> Tuple[State, ChainStats]:
+    """
+    Run a single annealing chain in a worker process, from a random initial state drawn with the given seed.
+    """
+    start = time.perf_counter()
+    random.seed(seed)
+    solver = worker_context()
+    solver.state = SAstate(bounds=solver.bounds, course_list=solver.course_list, date_list=solver.dates,
+                           dates_possible=solver.state.dates_possible, conflict_graph=solver.conflict_graph)
+    initial_penalty = solver.evaluator(solver.state)
+    state = solver.solve(QueueProgress(queue, chain_index), **solve_kwargs)
+    return state, ChainStats(seed, initial_penalty, solver.cur_pen, time.perf_counter() - start)
 
 
 class SAsolver(Solver):
@@ -117,15 +308,20 @@ class SAsolver(Solver):
         super(SAsolver, self).__init__(loader, evaluator)
         self.state = SAstate(bounds=bounds,
                              course_list=loader.get_course_list(),
-                             date_list=loader.get_available_dates())
+                             date_list=loader.get_available_dates(),
+                             conflict_graph=self.conflict_graph)
         self.cur_pen = self.evaluator(self.state)
         self.course_list = loader.get_course_list()
         self.weights = loader.get_course_pair_weights()
         self.dates = loader.get_available_dates()
         self.bounds = bounds
+        self._course_index: Dict[Course, int] = dict()  # position of every course in the directed sampler
+        self.iterations_run = 0  # iterations the last solve ran, the adaptive schedule may stop early
 
     def solve(self, progress_func: Callable, T0=None, iterations=ITERATION_N, re_gen = None,
-              stage_2_per = None, re_best = None) -> State:        
+              stage_2_per = None, re_best = None, directed=False, schedule=LINEAR_SCHEDULE,
+              checkpoint: str = None, resume=False, time_limit: float = None,
+              initial_state: State = None) -> State:        
         
         """
             Finds an optimal solution by running iterations, where at each iteration a change is made
@@ -134,16 +330,45 @@ class SAsolver(Solver):
         made each iteration changes thoughout the code in order to ensure more that we escape local minimas
         in large drainage basins. We also return to the best state found every re_best iterations in order 
         to ensure that we don't accedently leave a global minima once reached. 
+            If directed is True, the courses to move are drawn in proportion to their share in the penalty
+        (see Evaluator.course_penalties), so moves concentrate on the courses that cause collisions. The shares
+        are kept up to date from the accepted moves' deltas. Needs an evaluator that splits its penalty between
+        courses, such as SumEvaluator.
+            Cooling schedules:
+                LINEAR_SCHEDULE - fixed: linear steps of 1 down to 200, linear steps to 20 over the first stage,
+            then geometric. In a time limited run the steps down to 200 are stretched over HOT_STAGE_PER of the
+            iterations too.
+                ADAPTIVE_SCHEDULE - every ACCEPT_WINDOW moves the temperature is scaled so the ratio of uphill
+            (penalty increasing) moves accepted follows a target, which decays geometrically from ACCEPT_START to
+            ACCEPT_END over the iterations. The run stops early once the best penalty has not improved by PLATEAU_TOL
+            for PLATEAU_PER of the iterations.
+            The number of iterations actually run is kept in self.iterations_run.
+            If checkpoint is given, the run is saved to that file every few seconds (see Checkpointer). With resume,
+        a run with the same parameters continues from the file, if it exists, exactly as it would have gone on.
+            If time_limit is given, the run stops after time_limit seconds and settles on the best state found. The
+        iterations are then only a first estimate: every TIME_CHECK_EVERY iterations the number of iterations that
+        fit in the remaining time is estimated from the throughput so far, and the temperature schedule is stretched
+        to it.
+            If initial_state is given (a warm start), the run starts from it instead of from self.state, after the
+        courses it is missing are filled in (see Solver.complete_state), and T0 defaults to WARM_T0.
         """
         def reduce_T_lin(T: float) -> float:  # linear reduce by 1 for first stage (1000 iterations)
             if T > 200:
-                T -= 1
+                T -= hot_reduce_val
             elif T > 20:  # linear reduce by our linear_reduce_val for second stage
                 T -= linear_reduce_val
             else:
                 T = T * 0.1  # geometric reduce for third and final stage. (hill climbing stage)
             return T
 
+        def adapt_T(T: float, accept_rate: float, k: int) -> float:  # scale T towards the target acceptance ratio
+            target = ACCEPT_START * (ACCEPT_END / ACCEPT_START) ** (k / iterations)
+            accept_rate = max(accept_rate, 0.5 / ACCEPT_WINDOW)  # a window with no uphill move accepted
+            return T * (target / accept_rate) ** ADAPT_GAIN
+
+        if schedule not in SCHEDULES:
+            raise ValueError(f"Unknown cooling schedule {schedule}")
+
         # declare temperature / relocating values
         last_stage_per = 0.8 if stage_2_per is None else stage_2_per
         linear_reduce_val = 180 / (iterations * last_stage_per)
@@ -152,40 +377,166 @@ class SAsolver(Solver):
         
         
         # Simulated Annealing algorithm
-        T = T0 if T0 else DEFAULT_T0
+        if initial_state is not None:
+            self.state = SAstate(bounds=self.bounds, courses_and_dates=self.complete_state(initial_state).courses_dict,
+                                 dates_possible=self.state.dates_possible, move_tables=self.state.move_tables,
+                                 conflict_graph=self.conflict_graph)
+        T = T0 if T0 else (DEFAULT_T0 if initial_state is None else WARM_T0)
+        T_start = T
+        hot_reduce_val = 1 if time_limit is None else max(T_start - 200, 0) / (iterations * HOT_STAGE_PER)
         generator, subgroup_size = None, None
-        best = self.state
-        best_pen = float("inf")
+        self.cur_pen = self.evaluator(self.state)
+        best = self.state.copy()
+        best_pen = self.cur_pen
+        sampler = self._course_sampler() if directed else None
+        changes = None
         last_stage = iterations * last_stage_per
-        for k in range(iterations):
-            progress_func(k/iterations)
-            T = reduce_T_lin(T)
+        uphill, uphill_accepted = 0, 0  # uphill moves since the last update of the adaptive schedule
+        plateau_pen, plateau_start = best_pen, 0
+        start = 0
+        deadline = Deadline(time_limit)
+
+        checkpointer, params = None, None
+        if checkpoint:
+            checkpointer = Checkpointer(checkpoint, self.state.course_list, self.calendar)
+            params = dict(T0=T0, iterations=iterations, re_gen=re_gen, stage_2_per=stage_2_per, re_best=re_best,
+                          directed=directed, schedule=schedule, timed=time_limit is not None)
+            saved = checkpointer.load("SA", params) if resume else None
+            if saved:
+                iterations, deadline.start = saved["iterations"], deadline.start - saved["elapsed"]
+                linear_reduce_val = 180 / (iterations * last_stage_per)
+                if time_limit is not None:
+                    hot_reduce_val = max(T_start - 200, 0) / (iterations * HOT_STAGE_PER)
+                last_stage = iterations * last_stage_per
+                self.state = self._restore_state(checkpointer, saved["state"])
+                best = self._restore_state(checkpointer, saved["best"])
+                self.cur_pen, best_pen, T = saved["cur_pen"], saved["best_pen"], saved["T"]
+                start, generator, subgroup_size = saved["k"], saved["generator"], saved["subgroup_size"]
+                uphill, uphill_accepted = saved["uphill"], saved["uphill_accepted"]
+                plateau_pen, plateau_start = saved["plateau_pen"], saved["plateau_start"]
+                if directed:
+                    sampler = saved["sampler"]
+                    self._course_index = {course: i for i, course in enumerate(self.state.course_list)}
+                random.setstate(saved["random"])
+
+        start_time = deadline.elapsed()
+        estimated = time_limit is None  # a time limited run only stops on the iterations once they are estimated
+        for k in count(start):
+            if time_limit is not None and k > start and k % TIME_CHECK_EVERY == 0:
+                if deadline.expired():
+                    self.iterations_run = k
+                    break
+                # stretch the schedule over the iterations that fit in the remaining time
+                run_time = deadline.elapsed() - start_time
+                if run_time > 0:  # no estimate before the clock ticks
+                    iterations = k + int((k - start) / run_time * deadline.remaining()) + 1
+                    linear_reduce_val = 180 / (iterations * last_stage_per)
+                    hot_reduce_val = max(T_start - 200, 0) / (iterations * HOT_STAGE_PER)
+                    last_stage = iterations * last_stage_per
+                    estimated = True
+            if k >= iterations and estimated:
+                self.iterations_run = k
+                break
+            if checkpointer and checkpointer.due():
+                checkpointer.save("SA", params, dict(
+                    k=k, iterations=iterations, elapsed=deadline.elapsed(), T=T,
+                    generator=generator, subgroup_size=subgroup_size,
+                    state=checkpointer.pack(self.state), cur_pen=self.cur_pen,
+                    best=checkpointer.pack(best), best_pen=best_pen,
+                    uphill=uphill, uphill_accepted=uphill_accepted,
+                    plateau_pen=plateau_pen, plateau_start=plateau_start,
+                    sampler=sampler, random=random.getstate()))
+            progress_func(deadline.fraction() if time_limit is not None else k/iterations)
+            if schedule == LINEAR_SCHEDULE:
+                T = reduce_T_lin(T)
+            elif k and k % ACCEPT_WINDOW == 0:
+                T = adapt_T(T, uphill_accepted / max(uphill, 1), k)
+                uphill, uphill_accepted = 0, 0
+                if best_pen < plateau_pen * (1 - PLATEAU_TOL):
+                    plateau_pen, plateau_start = best_pen, k
+                elif k - plateau_start >= iterations * PLATEAU_PER:  # converged, settle on the best state
+                    self.state, self.cur_pen = best, best_pen
+                    self.iterations_run = k
+                    break
             if k % re_gen_val == 0:
                 generator = MOVE_ONE_GENERATOR if k > last_stage else choice(GENERATORS)
                 subgroup_size = choice([1, 2]) if k > last_stage else choice(SUB_GROUP_N)
 
             # relocate back to best state found so far
             if k % re_best_val == 0 and k < last_stage:
-                self.state = best
+                self.state = best.copy()
+                self.cur_pen = best_pen
+                if directed:
+                    sampler = self._course_sampler()
 
-            # try something new
-            orig_state = self.state.get_successor(subgroup_size, generator)
-            old_pen = self.evaluator(orig_state)
-            new_pen = self.evaluator(self.state)
+            # try something new, only the pairs of the moved courses are evaluated again
+            courses2move = None
+            if directed:
+                changes = dict()
+                courses2move = [self.state.course_list[i] for i in sampler.sample_distinct(subgroup_size)]
+            journal = self.state.get_successor(subgroup_size, generator, courses2move)
+            old_pen = self.cur_pen
+            new_pen = old_pen + self.evaluator.delta(self.state, journal, changes)
 
             if new_pen < best_pen:  # update best so far
-                best = self.state
+                best = self.state.copy()
                 best_pen = new_pen
-            if new_pen < old_pen:
-                self.cur_pen = new_pen
-                continue
 
-            if T == 0:  # don't save if we are towards the end
-                self.state = orig_state
-                continue
-            calc = exp(- abs(old_pen - new_pen) / T)
-            if uniform(0, 1) < calc:
+            accept = new_pen < old_pen
+            if not accept and T != 0:  # don't save if we are towards the end
+                calc = exp(- abs(old_pen - new_pen) / T)
+                accept = uniform(0, 1) < calc
+                if new_pen > old_pen:
+                    uphill += 1
+                    uphill_accepted += accept
+            if not accept:
+                self.state.undo(journal)
                 continue
-            self.state = orig_state
+            self.cur_pen = new_pen
+            if directed:
+                for course, change in changes.items():
+                    sampler.add(self._course_index[course], change)
 
+        if time_limit is not None:  # anytime run, settle on the best state found
+            self.state, self.cur_pen = best, best_pen
         return self.state
+
+    def _restore_state(self, checkpointer: Checkpointer, packed: Tuple[bytes, bytes]) -> SAstate:
+        return SAstate(bounds=self.bounds, courses_and_dates=checkpointer.unpack(packed),
+                       dates_possible=self.state.dates_possible, move_tables=self.state.move_tables,
+                       conflict_graph=self.conflict_graph)
+
+    def _course_sampler(self) -> FenwickSampler:
+        """
+            Builds the sampler of directed moves over the current state's course list. Every course gets its share
+        in the penalty plus a small floor, so courses without collisions are still moved once in a while.
+        """
+        penalties = self.evaluator.course_penalties(self.state)
+        self._course_index = {course: i for i, course in enumerate(self.state.course_list)}
+        floor = DIRECTED_FLOOR * sum(penalties.values()) / max(len(penalties), 1)
+        return FenwickSampler([penalties[course] + floor for course in self.state.course_list])
+
+    def solve_multi_start(self, progress_func: Callable, chains: int = None, seeds: Sequence[int] = None,
+                          workers: int = None, **solve_kwargs) -> Tuple[State, List[ChainStats]]:
+        """
+            Runs independent annealing chains in worker processes, each from its own random initial state, and
+        returns the state with the lowest penalty. The solver is sent to each worker once, when the pool starts.
+        :param progress_func: Called with the mean progress of all chains.
+        :param chains: Number of chains. default: one per core
+        :param seeds: Random seed of every chain. default: drawn from random
+        :param workers: Number of worker processes. default: one per core, at most one per chain
+        :param solve_kwargs: Passed to solve for every chain (T0, iterations, ...)
+        :return: The best state found and the statistics of every chain, in chain order.
+        """
+        if seeds is None:
+            seeds = [random.randrange(2 ** 32) for _ in range(chains or os.cpu_count())]
+        workers = workers or min(len(seeds), os.cpu_count())
+
+        with spawn_pool_with_progress(workers, self) as (pool, queue, _):
+            futures = [pool.submit(_run_chain, queue, i, seed, solve_kwargs) for i, seed in enumerate(seeds)]
+            wait_with_progress(futures, queue, progress_func)
+            results = [future.result() for future in futures]
+
+        best_state, best_stats = min(results, key=lambda result: result[1].penalty)
+        self.state, self.cur_pen = best_state, best_stats.penalty
+        return best_state, [stats for _, stats in results]
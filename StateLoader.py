@@ -120,6 +120,6 @@ class StateLoader:
 
     def get_state(self):
         """
-        Returns the read state.
+        Returns the read state. It is empty if no row of the file matched the courses.
         """
-        return State(self.state_dict)
+        return State(self.state_dict, keep_empty=True)
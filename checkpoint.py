@@ -0,0 +1,101 @@
+import os
+import pickle
+import time
+from array import array
+from datetime import date
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from exam_calendar import ExamCalendar
+from objects import Course
+from state import State, ArrayState
+
+CHECKPOINT_EVERY_SEC = 5.0
+CHECKPOINT_VERSION = 2
+
+
+class CheckpointMismatch(ValueError):
+    """
+    Raised when a checkpoint file was written by another solver, run or problem.
+    """
+
+
+class Checkpointer:
+    """
+    Writes and reads the checkpoints of a solver run. States are stored compactly, as the int16 calendar day arrays
+    of ArrayState in a fixed course order, so a checkpoint is a few kilobytes and writing one every few seconds does
+    not slow a run down. Every checkpoint is written to a temporary file and moved over the previous one, so a crash
+    while writing leaves the previous checkpoint intact.
+    A checkpoint records the solver kind, the run's parameters, the course numbers and the available dates (the days
+    of the stored states are counted from the first of them), and is only loaded by a run with the same ones.
+    """
+
+    def __init__(self, path: str, courses: Sequence[Course], calendar: ExamCalendar,
+                 every_sec: float = CHECKPOINT_EVERY_SEC):
+        """
+        :param path: Checkpoint file.
+        :param courses: Course order of the stored states. Resuming with the same order keeps the run bit-for-bit.
+        :param calendar: Day numbering of the problem.
+        :param every_sec: Minimal number of seconds between two checkpoints, see due.
+        """
+        self.path = path
+        self.courses = courses
+        self.calendar = calendar
+        self.every_sec = every_sec
+        self._last_save = time.monotonic()
+
+    def due(self) -> bool:
+        """
+        Returns True if every_sec seconds have passed since the last checkpoint (or since the run started).
+        """
+        return time.monotonic() - self._last_save >= self.every_sec
+
+    def save(self, kind: str, params: dict, data: dict):
+        """
+        Write a checkpoint, replacing the previous one.
+        :param kind: Name of the solver that writes it.
+        :param params: Parameters of the run, a resumed run must have the same.
+        :param data: Progress of the run. Use pack to store states.
+        """
+        checkpoint = dict(version=CHECKPOINT_VERSION, kind=kind, params=params,
+                          courses=[course.number for course in self.courses], dates=self._dates(), data=data)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "wb") as f:
+            pickle.dump(checkpoint, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, self.path)
+        self._last_save = time.monotonic()
+
+    def load(self, kind: str, params: dict) -> Optional[dict]:
+        """
+        Read the checkpoint.
+        :return: The data saved with it, or None if there is no checkpoint file.
+        :raise CheckpointMismatch: If the checkpoint was written by another solver, run or problem.
+        """
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, "rb") as f:
+            checkpoint = pickle.load(f)
+        if checkpoint.get("version") != CHECKPOINT_VERSION or checkpoint.get("kind") != kind:
+            raise CheckpointMismatch(f"{self.path} is not a {kind} checkpoint")
+        if checkpoint["params"] != params:
+            raise CheckpointMismatch(f"{self.path} was written by a run with other parameters: {checkpoint['params']}")
+        if checkpoint["courses"] != [course.number for course in self.courses]:
+            raise CheckpointMismatch(f"{self.path} was written for other courses")
+        if checkpoint["dates"] != self._dates():
+            raise CheckpointMismatch(f"{self.path} was written for other exam dates")
+        return checkpoint["data"]
+
+    def _dates(self) -> Tuple[List[date], List[date]]:
+        return list(self.calendar.moed_a_dates), list(self.calendar.moed_b_dates)
+
+    def pack(self, state: State) -> Tuple[bytes, bytes]:
+        """
+        Returns the moed a and moed b days of a state, as int16 buffers in the checkpointer's course order.
+        """
+        compact = ArrayState.from_state(state, self.courses, self.calendar)
+        return compact.moed_a.tobytes(), compact.moed_b.tobytes()
+
+    def unpack(self, packed: Tuple[bytes, bytes]) -> Dict[Course, Tuple[date, date]]:
+        """
+        Returns the dates of a packed state, as a courses_dict in the checkpointer's course order.
+        """
+        return ArrayState(self.courses, self.calendar, array('h', packed[0]), array('h', packed[1])).courses_dict
@@ -0,0 +1,80 @@
+from array import array
+from typing import List, Callable, Dict, Iterator, Tuple
+
+from objects import *
+
+
+class ConflictGraph:
+    """
+    Compact adjacency of the courses conflict graph, stored CSR style. Every course gets a dense index (its position
+    in courses), and the neighbours of course i - the courses that have a non zero pair weight with it - are
+    indices[indptr[i]:indptr[i + 1]], with the matching pair weights in weights[indptr[i]:indptr[i + 1]].
+    Every edge is stored in both directions.
+    """
+
+    def __init__(self, courses: List[Course], pair_weights: Dict[Course, Dict[Course, float]]):
+        """
+        Build the graph.
+        :param courses: List of all courses of the problem.
+        :param pair_weights: Nested mapping course1 -> course2 -> weight of the pair. Every pair should appear once,
+        in either order. Pairs of weight 0 and pairs of a course with itself are dropped.
+        """
+        self.courses = list(courses)
+        self.index: Dict[Course, int] = {course: i for i, course in enumerate(self.courses)}
+
+        adjacency: List[Dict[int, float]] = [dict() for _ in self.courses]
+        for course1, others in pair_weights.items():
+            if course1 not in self.index:
+                continue
+            i = self.index[course1]
+            for course2, weight in others.items():
+                if course2 not in self.index or course2 == course1 or weight == 0:
+                    continue
+                j = self.index[course2]
+                adjacency[i][j] = adjacency[i].get(j, 0) + weight
+                adjacency[j][i] = adjacency[j].get(i, 0) + weight
+
+        self.indptr = array('l', [0])
+        self.indices = array('l')
+        self.weights = array('d')
+        for neighbours in adjacency:
+            for j in sorted(neighbours):
+                self.indices.append(j)
+                self.weights.append(neighbours[j])
+            self.indptr.append(len(self.indices))
+
+    @staticmethod
+    def from_pair_weights(courses: List[Course], course_pair_evaluate: Callable[[Course, Course], float]):
+        """
+        Build the graph out of a pair weight function, by checking all pairs of courses once.
+        """
+        pair_weights: Dict[Course, Dict[Course, float]] = dict()
+        for i in range(len(courses)):
+            pair_weights[courses[i]] = dict()
+            for j in range(i + 1, len(courses)):
+                weight = course_pair_evaluate(courses[i], courses[j])
+                if weight != 0:
+                    pair_weights[courses[i]][courses[j]] = weight
+        return ConflictGraph(courses, pair_weights)
+
+    def neighbours(self, i: int) -> Iterator[Tuple[int, float]]:
+        """
+        Iterate over (index, weight) of the neighbours of the course with index i.
+        """
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return zip(self.indices[start:end], self.weights[start:end])
+
+    def degree(self, i: int) -> int:
+        return self.indptr[i + 1] - self.indptr[i]
+
+    def num_edges(self) -> int:
+        """
+        Number of distinct course pairs with a non zero weight.
+        """
+        return len(self.indices) // 2
+
+    def __contains__(self, course: Course):
+        return course in self.index
+
+    def __len__(self):
+        return len(self.courses)
@@ -3,6 +3,8 @@ from typing import List, Callable, Tuple
 from datetime import date
 from datetime import timedelta
 from objects import *
+from conflict_graph import ConflictGraph
+from exam_calendar import ExamCalendar, get_calendar
 
 
 class Dataloader:
@@ -16,6 +18,8 @@ class Dataloader:
         self.not_allowed = not_allowed
         self.moedA_dates = []
         self.moedB_dates = []
+        self._conflict_graph = None
+        self._exam_calendar = None
 
     def _create_available_dates(self):
         if (self.endB - self.endA).days < MIN_DAYS_FROM_A_TO_B:
@@ -47,6 +51,24 @@ class Dataloader:
         """
         pass
 
+    def get_conflict_graph(self) -> ConflictGraph:
+        """
+        Return the sparse conflict graph of the courses - for every course, only the courses it has a non zero
+        weight with. Built once, from the pair weights of all courses.
+        """
+        if self._conflict_graph is None:
+            self._conflict_graph = ConflictGraph.from_pair_weights(self.get_course_list(),
+                                                                   self.get_course_pair_weights())
+        return self._conflict_graph
+
+    def get_exam_calendar(self) -> ExamCalendar:
+        """
+        Return the day numbering of the available dates, for compact integer schedules.
+        """
+        if self._exam_calendar is None:
+            self._exam_calendar = get_calendar(*self.get_available_dates())
+        return self._exam_calendar
+
     def get_available_dates(self) -> Tuple[List[date], List[date]]:
         """
         :return: Tuple of two lists: a list of all available dates for moed a exams, and a list of all
@@ -0,0 +1,90 @@
+from bisect import bisect_left, bisect_right
+from datetime import date
+from functools import lru_cache
+from typing import Dict, List, Sequence, Tuple
+
+from objects import MIN_DAYS_FROM_A_TO_B
+
+CALENDAR_CACHE = 8
+
+
+class ExamCalendar:
+    """
+    Numbering of the exam days of a problem. Every date is mapped to a small integer day - the number of days since
+    the first available exam date - so schedules can be kept in compact integer arrays and the distance between two
+    exams is a plain subtraction.
+    The calendar also holds the admissible (moed a, moed b) pairs - at least MIN_DAYS_FROM_A_TO_B days apart, moed b
+    last - as index ranges: the moed b dates that can follow a moed a date are a suffix of moed_b_dates, and the moed
+    a dates that can precede a moed b date are a prefix of moed_a_dates. See admissible.
+    """
+
+    def __init__(self, moed_a_dates: Sequence[date], moed_b_dates: Sequence[date]):
+        """
+        :param moed_a_dates: Available dates for moed a exams.
+        :param moed_b_dates: Available dates for moed b exams.
+        """
+        self.moed_a_dates: List[date] = sorted(moed_a_dates)
+        self.moed_b_dates: List[date] = sorted(moed_b_dates)
+        self.first_date = min(self.moed_a_dates + self.moed_b_dates)
+        self._origin = self.first_date.toordinal()
+
+        self.moed_a_days: List[int] = [self.day_of(d) for d in self.moed_a_dates]
+        self.moed_b_days: List[int] = [self.day_of(d) for d in self.moed_b_dates]
+
+        # moed -> date of the other moed -> (start, stop) indices of the dates of moed it can be paired with
+        self._admissible: Tuple[Dict[date, Tuple[int, int]], Dict[date, Tuple[int, int]]] = (
+            {d: self._admissible_range(0, d) for d in self.moed_b_dates},
+            {d: self._admissible_range(1, d) for d in self.moed_a_dates})
+
+    def day_of(self, d: date) -> int:
+        """
+        Returns the day number of a date. Dates before the first exam date get negative days.
+        """
+        return d.toordinal() - self._origin
+
+    def date_of(self, day: int) -> date:
+        """
+        Returns the date of a day number.
+        """
+        return date.fromordinal(day + self._origin)
+
+    def get_dates(self, moed: int) -> List[date]:
+        return self.moed_a_dates if moed == 0 else self.moed_b_dates
+
+    def get_days(self, moed: int) -> List[int]:
+        return self.moed_a_days if moed == 0 else self.moed_b_days
+
+    @property
+    def num_days(self) -> int:
+        """
+        Number of days from the first exam date to the last one, inclusive.
+        """
+        return max(self.moed_a_days + self.moed_b_days) + 1
+
+    def admissible(self, moed: int, other_date: date) -> Tuple[int, int]:
+        """
+        Returns the index range [start, stop) of the dates of moed (in get_dates(moed)) that can be paired with an
+        exam of the other moed on other_date. O(1) for the available dates of the other moed, which are precomputed,
+        O(log n) for any other date. The range is empty if there is no such date.
+        """
+        known = self._admissible[moed].get(other_date)
+        return known if known is not None else self._admissible_range(moed, other_date)
+
+    def _admissible_range(self, moed: int, other_date: date) -> Tuple[int, int]:
+        other_day = self.day_of(other_date)
+        if moed == 0:
+            return 0, bisect_right(self.moed_a_days, other_day - MIN_DAYS_FROM_A_TO_B)
+        return bisect_left(self.moed_b_days, other_day + MIN_DAYS_FROM_A_TO_B), len(self.moed_b_days)
+
+
+@lru_cache(maxsize=CALENDAR_CACHE)
+def _cached_calendar(moed_a_dates: Tuple[date, ...], moed_b_dates: Tuple[date, ...]) -> ExamCalendar:
+    return ExamCalendar(moed_a_dates, moed_b_dates)
+
+
+def get_calendar(moed_a_dates: Sequence[date], moed_b_dates: Sequence[date]) -> ExamCalendar:
+    """
+    Returns the calendar of the given available dates. Calendars are cached by their content, so the states and the
+    loader of a problem share a single calendar and its tables are built once per problem.
+    """
+    return _cached_calendar(tuple(sorted(moed_a_dates)), tuple(sorted(moed_b_dates)))
@@ -1,14 +1,87 @@
-from typing import Tuple, List, Dict
+import os
+import random
+from array import array
+from itertools import count
+from typing import Tuple, List, Dict, Sequence
 import numpy as np
-from state import State
+from checkpoint import Checkpointer
+from progress import QueueProgress, wait_with_progress, spawn_pool, spawn_pool_with_progress, worker_context
+from state import State, ArrayState, NumpyEvaluator
 from solver import *
 
+WARM_PERTURB = 3  # random date changes in each copy of the initial state that seeds a warm started population
+
+# Crossovers of the matrix mode, see GeneticSolver.solve
+UNIFORM_CROSSOVER = "uniform"
+ONE_POINT_CROSSOVER = "one_point"
+TWO_POINT_CROSSOVER = "two_point"
+CROSSOVERS = [UNIFORM_CROSSOVER, ONE_POINT_CROSSOVER, TWO_POINT_CROSSOVER]
+
+STEADY_STATE_OFFSPRING = 2  # children bred every generation of the steady state variant
+
+# Island model, see GeneticSolver.solve_islands
+MIGRATE_EVERY = 10  # generations between two migrations
+MIGRANTS = 2  # fittest states every island sends to the next one
+MIGRATION_TIMEOUT_SEC = 120  # an island gives up waiting for migrants after this long (its neighbor failed)
+
+
+def _evaluate_fitness_chunk(moed_a: np.ndarray, moed_b: np.ndarray) -> List[float]:
+    """
+    Evaluate, in a worker process, the states given as rows of (states x courses) int16 calendar day matrices.
+    The worker context is the (evaluator, courses, calendar) of the solver that starts the pool.
+    """
+    evaluator, courses, calendar = worker_context()
+    if isinstance(evaluator, NumpyEvaluator) and evaluator.conflict_graph is not None and \
+            evaluator.conflict_graph.courses == courses:
+        return evaluator.evaluate_days(moed_a.astype(np.int64), moed_b.astype(np.int64)).tolist()
+    states = [ArrayState(courses, calendar, array('h', a.tobytes()), array('h', b.tobytes()))
+              for a, b in zip(moed_a, moed_b)]
+    return evaluator.evaluate_population(states)
+
+
+def _run_island(progress_queue, island: int, inbox, outbox, seed: int, epochs: int, migrate_every: int,
+                migrants: int, deadline: Deadline) -> Tuple[State, float]:
+    """
+    Evolve one island of GeneticSolver.solve_islands in a worker process, from a random population drawn with the
+    given seed, for epochs of migrate_every generations, or until deadline expires if it has seconds. After every
+    epoch but the last, the island puts its migrants fittest states on outbox, as int16 day arrays, and replaces its
+    least fit states with the ones the previous island put on inbox. outbox is None if there is a single island.
+    The worker context is the solver.
+    :return: The fittest state of the island and its penalty.
+    """
+    solver = worker_context()
+    timed = deadline.seconds is not None
+    random.seed(seed)
+    np.random.seed(seed)
+    courses, calendar = solver.conflict_graph.courses, solver.calendar
+    solver.population = [State(course_list=solver.course_list, date_list=(solver.moed_a_dates, solver.moed_b_dates))
+                         for _ in solver.population]
+    report = QueueProgress(progress_queue, island)
+    best = None
+    for epoch in count():
+        epoch_report = report if timed else lambda progress: report((epoch + progress) / epochs)
+        fitness, best = solver._evolve_fitness(epoch_report, migrate_every, False, deadline=deadline, best=best,
+                                               max_generations=migrate_every)
+        # a timed island sends its migrants before it checks the deadline, the next island may still be waiting
+        # for them when it expires
+        last = deadline.expired() if timed else epoch == epochs - 1
+        if outbox is not None and (timed or not last):
+            sent = [ArrayState.from_state(state, courses, calendar) for state, _ in fitness[:migrants]]
+            outbox.put([(state.moed_a, state.moed_b) for state in sent])
+        if last:
+            break
+        if outbox is not None:
+            arrived = inbox.get(timeout=MIGRATION_TIMEOUT_SEC)
+            solver.population = [state for state, _ in fitness[:len(fitness) - len(arrived)]] + \
+                                [ArrayState(courses, calendar, moed_a, moed_b).to_state() for moed_a, moed_b in arrived]
+    return best if best is not None and best[1] < fitness[0][1] else fitness[0]
+
 
 class GeneticSolver(Solver):
 
-    NUM_CALLS = 0
     def __init__(self, loader: Dataloader, evaluator: Evaluator,
-                 initial_population=30, p_mutate=0.7, p_fittness_geom=0.3):
+                 initial_population=30, p_mutate=0.7, p_fittness_geom=0.3, workers=None, local_search=0,
+                 local_search_top: int = None):
         """
         Create a new genetic solver.
         :param loader: Dataloader for this problem.
@@ -16,6 +89,12 @@ class GeneticSolver(Solver):
         :param initial_population: Number of initial states to seed population at first generation.
         :param p_mutate: Probability of a mutation during reproduction.
         :param p_fittness_geom: Probability of selection of a fit subject (Geometric)
+        :param workers: Number of worker processes to evaluate the population with. The evaluator is sent to each
+        worker once, when the pool starts, and states are sent as int16 day arrays. default: None (no workers)
+        :param local_search: Memetic step - number of moves of the hill climb (see _hill_climb) every child makes
+        before it enters the population. Not available in the matrix mode. default: 0 (no local search)
+        :param local_search_top: If given, the local_search_top fittest states of every generation make the hill
+        climb instead of the children.
         """
         super(GeneticSolver, self).__init__(loader, evaluator)
         self.population = [State(course_list=loader.get_course_list(),
@@ -23,33 +102,380 @@ class GeneticSolver(Solver):
                            for _ in range(initial_population)]
         self.__p_mutate = p_mutate
         self.__p_fitness_geom = p_fittness_geom
+        self.__workers = workers
+        self.__pool = None
+        self.__local_search = local_search
+        self.__local_search_top = local_search_top
 
-    def solve(self, progress_func: Callable, iterations=50, verbose=False):
+    def solve(self, progress_func: Callable, iterations=50, verbose=False, checkpoint: str = None, resume=False,
+              time_limit: float = None, initial_state: State = None, matrix=False, crossover=UNIFORM_CROSSOVER,
+              steady_state=False, offspring=STEADY_STATE_OFFSPRING):
+        """
+        Evolve the population for the given number of generations and return the fittest state.
+        :param checkpoint: File to save the run to every few seconds (see Checkpointer). default: no checkpoints
+        :param resume: Continue a run with the same number of generations from the checkpoint file, if it exists,
+        exactly as it would have gone on.
+        :param time_limit: If given, evolve for time_limit seconds instead of for the given number of generations,
+        and return the fittest state of all generations.
+        :param initial_state: Schedule to warm start from. Courses it is missing are filled in (see
+        Solver.complete_state), and the population is replaced by the completed schedule and copies of it with
+        WARM_PERTURB random date changes each.
+        :param matrix: Evolve the population as (population x courses) day matrices, see _evolve_matrix.
+        :param crossover: Crossover of the matrix mode, one of CROSSOVERS.
+        :param steady_state: Run the elitist steady state variant, see _evolve_steady. Not available in the matrix
+        mode.
+        :param offspring: Number of children every generation of the steady state variant breeds.
+        """
+        if matrix and steady_state:
+            raise ValueError("The steady state variant does not have a matrix mode")
+        if matrix and self.__local_search:
+            raise ValueError("The local search does not have a matrix mode")
+        if initial_state is not None:
+            initial_state = self.complete_state(initial_state)
+            self.population = [initial_state] + [self._perturbed(initial_state)
+                                                 for _ in range(len(self.population) - 1)]
+        checkpointer = Checkpointer(checkpoint, self.course_list, self.calendar) if checkpoint else None
+        params = self._checkpoint_params(iterations, time_limit, crossover=crossover if matrix else None,
+                                         offspring=offspring if steady_state else None)
+        deadline = Deadline(time_limit)
+        start, best, fitness = 0, None, None
+        if checkpointer and resume:
+            saved = checkpointer.load("genetic", params)
+            if saved:
+                self.population = [State(checkpointer.unpack(packed)) for packed in saved["population"]]
+                start, deadline.start = saved["generation"], deadline.start - saved["elapsed"]
+                if saved["best"]:
+                    best = State(checkpointer.unpack(saved["best"][0])), saved["best"][1]
+                if saved.get("fitness"):
+                    fitness = list(zip(self.population, saved["fitness"]))
+                random.setstate(saved["random"])
+                np.random.set_state(saved["np_random"])
 
-        GeneticSolver.NUM_CALLS += 1
+        if self.__workers:
+            self.__pool = spawn_pool(self.__workers, (self.evaluator, self.conflict_graph.courses, self.calendar))
+        try:
+            if matrix:
+                return self._evolve_matrix(progress_func, iterations, verbose, crossover, start, checkpointer,
+                                           deadline, best)
+            if steady_state:
+                return self._evolve_steady(progress_func, iterations, verbose, offspring, start, checkpointer,
+                                           deadline, fitness)
+            return self._evolve(progress_func, iterations, verbose, start, checkpointer, deadline, best)
+        finally:
+            if self.__pool:
+                self.__pool.shutdown()
+                self.__pool = None
 
-        for i in range(iterations):
+    def solve_islands(self, progress_func: Callable, iterations=50, islands: int = None, seeds: Sequence[int] = None,
+                      migrate_every=MIGRATE_EVERY, migrants=MIGRANTS, time_limit: float = None) -> State:
+        """
+            Island model. Every island evolves its own population, of the size of this solver's population and from
+        its own random states, in its own worker process. Every migrate_every generations each island sends copies
+        of its migrants fittest states to the next island of a ring, through a queue, where they replace the least
+        fit states. The islands keep apart the diversity a single population loses, while migration spreads good
+        schedules between them. The solver is sent to each worker once, when the pool starts.
+        :param progress_func: Called with the mean progress of all islands.
+        :param iterations: Number of generations of every island, rounded up to whole migration epochs.
+        :param islands: Number of islands. default: one per core
+        :param seeds: Random seed of every island, instead of islands. default: drawn from random
+        :param time_limit: If given, every island evolves until time_limit seconds pass, instead of for the given
+        number of generations.
+        :return: The fittest state of all islands.
+        """
+        deadline = Deadline(time_limit)
+        if seeds is None:
+            seeds = [random.randrange(2 ** 32) for _ in range(islands or os.cpu_count())]
+        epochs = max(-(-iterations // migrate_every), 1)
+
+        # every island waits for its neighbor's migrants, so all of them must run at once
+        with spawn_pool_with_progress(len(seeds), self) as (pool, progress_queue, manager):
+            inboxes = [manager.Queue() for _ in seeds]
+            futures = [pool.submit(_run_island, progress_queue, i, inboxes[i],
+                                   inboxes[(i + 1) % len(seeds)] if len(seeds) > 1 else None,
+                                   seed, epochs, migrate_every, migrants, deadline)
+                       for i, seed in enumerate(seeds)]
+            wait_with_progress(futures, progress_queue, progress_func)
+            results = [future.result() for future in futures]
+        return min(results, key=lambda result: result[1])[0]
+
+    def _evolve(self, progress_func: Callable, iterations: int, verbose: bool, start: int = 0,
+                checkpointer: Checkpointer = None, deadline: Deadline = None,
+                best: Tuple[State, float] = None) -> State:
+        """
+        Run the generations of solve, from generation start, and return the fittest state of the last one. With a
+        time limited deadline, run until it expires and return the fittest state of all generations, where best is
+        the fittest state of the generations before start.
+        """
+        fitness, best = self._evolve_fitness(progress_func, iterations, verbose, start, checkpointer, deadline, best)
+        if best is not None and best[1] < fitness[0][1]:
+            return best[0]
+        return fitness[0][0]
+
+    def _evolve_fitness(self, progress_func: Callable, iterations: int, verbose: bool, start: int = 0,
+                        checkpointer: Checkpointer = None, deadline: Deadline = None,
+                        best: Tuple[State, float] = None, max_generations: int = None) \
+            -> Tuple[List[Tuple[State, float]], Tuple[State, float]]:
+        """
+        The generations of _evolve.
+        :param max_generations: If given, stop after this many generations even if the run is time limited (an
+        epoch of an island).
+        :return: The fitness of the last generation, as _get_fitness returns it, and the fittest state of all
+        generations with its fitness, None if the run is not time limited.
+        """
+        deadline = deadline or Deadline()
+        timed = deadline.seconds is not None
+        for i in count(start):
+            if deadline.expired() or (not timed and i >= iterations) or \
+                    (max_generations is not None and i - start >= max_generations):
+                break
+            if checkpointer and checkpointer.due():
+                self._save_checkpoint(checkpointer, self._checkpoint_params(iterations, deadline.seconds), i,
+                                      [checkpointer.pack(state) for state in self.population], best, deadline)
             if verbose:
                 print(i)
 
-            self._update_prog_func(progress_func, i, iterations)
+            progress_func(deadline.fraction() if timed else i / iterations)
 
-            fitness = sorted([(state, self.evaluator(state)) for state in self.population],
-                             key=lambda x: x[1], reverse=False)
+            fitness = self._polish(self._get_fitness(self.population))
+            if timed and (best is None or fitness[0][1] < best[1]):
+                best = fitness[0]
             new_population = []
             for _ in range(len(self.population)):
                 x = self._random_select(fitness)
                 y = self._random_select(fitness)
                 z = (self._combine(x, y))
                 z = self._mutate(z)
+                z = self._climb_child(z)
                 new_population.append(z)
             self.population = new_population
             if verbose:
                 print(f"Current best fitness: {fitness[0][1]}")
-        fitness = sorted([(state, self.evaluator(state)) for state in self.population],
-                         key=lambda x: x[1], reverse=False)
+        return self._get_fitness(self.population), best
+
+    def _evolve_steady(self, progress_func: Callable, iterations: int, verbose: bool, offspring: int,
+                       start: int = 0, checkpointer: Checkpointer = None, deadline: Deadline = None,
+                       fitness: List[Tuple[State, float]] = None) -> State:
+        """
+        The generations of _evolve as a steady state, elitist GA. The population is kept along with its fitness,
+        sorted from the fittest, and every generation breeds only offspring children, which replace the least fit
+        members they are fitter than. Only the children are evaluated, and the fittest state is never replaced by a
+        less fit one, so the best fitness never gets worse and the fittest member is the fittest state of the run.
+        :param fitness: Fitness of the population, as _get_fitness returns it. default: evaluate the population
+        """
+        deadline = deadline or Deadline()
+        timed = deadline.seconds is not None
+        if fitness is None:
+            fitness = self._get_fitness(self.population)
+        params = self._checkpoint_params(iterations, deadline.seconds, offspring=offspring)
+        for i in count(start):
+            if deadline.expired() or (not timed and i >= iterations):
+                break
+            if checkpointer and checkpointer.due():
+                self._save_checkpoint(checkpointer, params, i, [checkpointer.pack(state) for state, _ in fitness], None,
+                                      deadline, [penalty for _, penalty in fitness])
+            if verbose:
+                print(i)
+
+            progress_func(deadline.fraction() if timed else i / iterations)
+
+            fitness = self._polish(fitness)
+            children = [self._climb_child(self._mutate(self._combine(self._random_select(fitness),
+                                                                     self._random_select(fitness))))
+                        for _ in range(offspring)]
+            # stable sort: a child only replaces a member it is strictly fitter than
+            fitness = sorted(fitness + self._get_fitness(children), key=lambda x: x[1])[:len(fitness)]
+            if verbose:
+                print(f"Current best fitness: {fitness[0][1]}")
+        self.population = [state for state, _ in fitness]
         return fitness[0][0]
 
+    def _evolve_matrix(self, progress_func: Callable, iterations: int, verbose: bool, crossover: str,
+                       start: int = 0, checkpointer: Checkpointer = None, deadline: Deadline = None,
+                       best: Tuple[State, float] = None) -> State:
+        """
+        The generations of _evolve, on the population as two (population x courses) int16 matrices of calendar
+        days, in the conflict graph's course order. Selection, crossover and mutation are NumPy operations over the
+        whole generation (see _matrix_generation), so a generation costs little more than its fitness evaluation.
+        self.population is updated to the last generation when the run ends.
+        """
+        deadline = deadline or Deadline()
+        timed = deadline.seconds is not None
+        moed_a, moed_b = self._to_matrices(self.population)
+        params = self._checkpoint_params(iterations, deadline.seconds, crossover=crossover)
+        for i in count(start):
+            if deadline.expired() or (not timed and i >= iterations):
+                break
+            if checkpointer and checkpointer.due():
+                self._save_checkpoint(checkpointer, params, i, self._pack_matrices(checkpointer, moed_a, moed_b), best,
+                                      deadline)
+            if verbose:
+                print(i)
+
+            progress_func(deadline.fraction() if timed else i / iterations)
+
+            penalties = self._matrix_fitness(moed_a, moed_b)
+            fittest = int(np.argmin(penalties))
+            if timed and (best is None or penalties[fittest] < best[1]):
+                best = self._row_state(moed_a, moed_b, fittest), penalties[fittest]
+            moed_a, moed_b = self._matrix_generation(moed_a, moed_b, penalties, crossover)
+            if verbose:
+                print(f"Current best fitness: {penalties[fittest]}")
+        self.population = [state.to_state() for state in self._from_matrices(moed_a, moed_b)]
+        penalties = self._matrix_fitness(moed_a, moed_b)
+        fittest = int(np.argmin(penalties))
+        if best is not None and best[1] < penalties[fittest]:
+            return best[0]
+        return self.population[fittest]
+
+    def _matrix_generation(self, moed_a: np.ndarray, moed_b: np.ndarray, penalties: np.ndarray,
+                           crossover: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Breed the next generation of the matrix mode: select parent pairs by geometric rank, as _random_select
+        does, cross them over with the crossover and mutate the children.
+        :return: The moed a and moed b day matrices of the children.
+        """
+        size, n = moed_a.shape
+        ranked = np.argsort(penalties, kind="stable")
+        picks = np.minimum(np.random.geometric(self.__p_fitness_geom, size=(2, size)) - 1, size - 1)
+        x, y = ranked[picks[0]], ranked[picks[1]]
+        # a course takes both of its dates from the same parent, so crossover keeps the gap between them
+        from_x = self._crossover_mask(size, n, crossover)
+        child_a = np.where(from_x, moed_a[x], moed_a[y])
+        child_b = np.where(from_x, moed_b[x], moed_b[y])
+        self._mutate_matrices(child_a, child_b)
+        return child_a, child_b
+
+    @staticmethod
+    def _crossover_mask(size: int, n: int, crossover: str) -> np.ndarray:
+        """
+        Returns a (size x n) mask of the courses every child takes from its first parent.
+        """
+        if crossover == UNIFORM_CROSSOVER:
+            return np.random.random((size, n)) < 0.5
+        positions = np.arange(n)
+        if crossover == ONE_POINT_CROSSOVER:
+            return positions < np.random.randint(1, max(n, 2), size=(size, 1))
+        if crossover == TWO_POINT_CROSSOVER:
+            cuts = np.sort(np.random.randint(0, n + 1, size=(size, 2)), axis=1)
+            return (positions < cuts[:, :1]) | (positions >= cuts[:, 1:])
+        raise ValueError(f"Unknown crossover {crossover}, expected one of {CROSSOVERS}")
+
+    def _mutate_matrices(self, moed_a: np.ndarray, moed_b: np.ndarray):
+        """
+        The mutation of _mutate over a generation, in place: with probability p_mutate a child moves one of the
+        exams of a random course to a random date of its moed. Masked repair: moves that leave less than
+        MIN_DAYS_FROM_A_TO_B days between the course's exams are redrawn from the admissible days, whose range is
+        found by binary search in the sorted days of the moed. A move with no admissible day is dropped.
+        """
+        size, n = moed_a.shape
+        rows = np.flatnonzero(np.random.random(size) < self.__p_mutate)
+        cols = np.random.randint(n, size=len(rows))
+        moeds = np.random.randint(2, size=len(rows))
+        for moed, matrix, other_matrix in ((0, moed_a, moed_b), (1, moed_b, moed_a)):
+            days = np.array(self.calendar.get_days(moed), dtype=np.int16)
+            r, c = rows[moeds == moed], cols[moeds == moed]
+            new, other = days[np.random.randint(len(days), size=len(r))], other_matrix[r, c]
+            illegal = (other - new if moed == 0 else new - other) < MIN_DAYS_FROM_A_TO_B
+            other = other[illegal]
+            if moed == 0:
+                low = np.zeros(len(other), dtype=np.int64)
+                high = np.searchsorted(days, other - MIN_DAYS_FROM_A_TO_B, "right")
+            else:
+                low, high = np.searchsorted(days, other + MIN_DAYS_FROM_A_TO_B, "left"), np.full(len(other), len(days))
+            redrawn = np.minimum(low + (np.random.random(len(other)) * (high - low)).astype(np.int64), len(days) - 1)
+            new[illegal] = np.where(high > low, days[redrawn], matrix[r[illegal], c[illegal]])
+            matrix[r, c] = new
+
+    def _matrix_fitness(self, moed_a: np.ndarray, moed_b: np.ndarray) -> np.ndarray:
+        """
+        Evaluate the states of day matrices: in one pass with a NumpyEvaluator of the conflict graph, otherwise
+        in the worker processes or through evaluate_population.
+        """
+        if self.__pool:
+            return np.array(self._evaluate_days_in_pool(moed_a, moed_b))
+        evaluator = self.evaluator
+        if isinstance(evaluator, NumpyEvaluator) and evaluator.conflict_graph is self.conflict_graph:
+            return evaluator.evaluate_days(moed_a.astype(np.int64), moed_b.astype(np.int64))
+        return np.array(evaluator.evaluate_population(self._from_matrices(moed_a, moed_b)))
+
+    def _to_matrices(self, population: Sequence[State]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the moed a and moed b days of the population as (population x courses) int16 matrices, in the
+        conflict graph's course order.
+        """
+        courses = self.conflict_graph.courses
+        moed_a = np.array([[self.calendar.day_of(state.courses_dict[c][0]) for c in courses] for state in population],
+                          dtype=np.int16)
+        moed_b = np.array([[self.calendar.day_of(state.courses_dict[c][1]) for c in courses] for state in population],
+                          dtype=np.int16)
+        return moed_a, moed_b
+
+    def _from_matrices(self, moed_a: np.ndarray, moed_b: np.ndarray) -> List[ArrayState]:
+        courses = self.conflict_graph.courses
+        return [ArrayState(courses, self.calendar, array('h', a.tobytes()), array('h', b.tobytes()))
+                for a, b in zip(moed_a, moed_b)]
+
+    def _pack_matrices(self, checkpointer: Checkpointer, moed_a: np.ndarray,
+                       moed_b: np.ndarray) -> List[Tuple[bytes, bytes]]:
+        """
+        Returns the rows of day matrices packed as Checkpointer.pack packs states, straight from the int16 buffers.
+        """
+        order = [self.conflict_graph.index[course] for course in checkpointer.courses]
+        moed_a, moed_b = moed_a[:, order], moed_b[:, order]
+        return [(a.tobytes(), b.tobytes()) for a, b in zip(moed_a, moed_b)]
+
+    def _row_state(self, moed_a: np.ndarray, moed_b: np.ndarray, row: int) -> State:
+        return self._from_matrices(moed_a[row:row + 1], moed_b[row:row + 1])[0].to_state()
+
+    def _checkpoint_params(self, iterations: int, time_limit: float, **mode) -> dict:
+        """
+        Returns the parameters a checkpoint of a run is written with: the run's and the solver's configuration. mode
+        holds the options of the variant that runs (crossover, offspring), options that are None are left out. Only
+        whether the run is time limited is kept, not the budget, which may differ between the run and its
+        resumption; the time used travels as elapsed.
+        """
+        params = dict(iterations=iterations, timed=time_limit is not None, population=len(self.population),
+                      local_search=self.__local_search, local_search_top=self.__local_search_top)
+        params.update((name, value) for name, value in mode.items() if value is not None)
+        return params
+
+    @staticmethod
+    def _save_checkpoint(checkpointer: Checkpointer, params: dict, generation: int,
+                         population: Sequence[Tuple[bytes, bytes]], best: Tuple[State, float], deadline: Deadline,
+                         fitness: Sequence[float] = None):
+        """
+        Write a checkpoint of a run, with the population packed (see Checkpointer.pack).
+        """
+        checkpointer.save("genetic", params, dict(
+            generation=generation, population=population,
+            best=(checkpointer.pack(best[0]), best[1]) if best else None, elapsed=deadline.elapsed(),
+            fitness=list(fitness) if fitness is not None else None,
+            random=random.getstate(), np_random=np.random.get_state()))
+
+    def _get_fitness(self, population: List[State]) -> List[Tuple[State, float]]:
+        """
+        Evaluate the whole population in a single call to the evaluator, so evaluators that work on batches
+        (NumpyEvaluator) score every member in one pass.
+        :return: List of tuples (state, fitness), sorted from the fittest state.
+        """
+        if self.__pool:
+            penalties = self._evaluate_in_pool(population)
+        else:
+            penalties = self.evaluator.evaluate_population(population)
+        return sorted(zip(population, penalties), key=lambda x: x[1], reverse=False)
+
+    def _evaluate_in_pool(self, population: List[State]) -> List[float]:
+        """
+        Split the population between the worker processes, as (states x courses) int16 calendar day matrices.
+        """
+        return self._evaluate_days_in_pool(*self._to_matrices(population))
+
+    def _evaluate_days_in_pool(self, moed_a: np.ndarray, moed_b: np.ndarray) -> List[float]:
+        chunks = np.array_split(np.arange(len(moed_a)), self.__workers)
+        futures = [self.__pool.submit(_evaluate_fitness_chunk, moed_a[chunk], moed_b[chunk])
+                   for chunk in chunks if len(chunk)]
+        return [penalty for future in futures for penalty in future.result()]
+
     def _random_select(self, fitnesses: List[Tuple[State, float]]) -> State:
         """
         Select a random subject from list of population with fitness values.
@@ -78,6 +504,57 @@ class GeneticSolver(Solver):
                 new_dict[course] = y.courses_dict[course]
         return State(new_dict)
 
+    def _climb_child(self, s: State) -> State:
+        """
+        The memetic step of a child: the hill climb, if local_search is set and not local_search_top.
+        :return: s after the hill climb.
+        """
+        if self.__local_search and self.__local_search_top is None:
+            self._hill_climb(s, self.__local_search)
+        return s
+
+    def _polish(self, fitness: List[Tuple[State, float]]) -> List[Tuple[State, float]]:
+        """
+        The memetic step of local_search_top: copies of the fittest states of a generation make the hill climb and
+        replace them. Their fitness is updated from the hill climb's deltas, without evaluating them again.
+        :param fitness: List of tuples (state, fitness), sorted from the fittest state.
+        :return: fitness with the polished states, sorted again.
+        """
+        if not self.__local_search or self.__local_search_top is None:
+            return fitness
+        top = self.__local_search_top
+        polished = []
+        for state, penalty in fitness[:top]:
+            state = State(dict(state.courses_dict))
+            polished.append((state, penalty + self._hill_climb(state, self.__local_search)))
+        return sorted(polished + fitness[top:], key=lambda x: x[1])
+
+    def _hill_climb(self, s: State, steps: int) -> float:
+        """
+        Bounded first improvement hill climb, in place: try steps random date changes (see _change_date) and keep
+        every one that lowers the penalty. Moves are scored by the evaluator's delta, which is incremental for
+        evaluators that sum over course pairs (SumEvaluator, NumpyEvaluator).
+        :return: The change in the penalty of s.
+        """
+        change = 0.0
+        for _ in range(steps):
+            course, old_dates = self._change_date(s)
+            diff = self.evaluator.delta(s, {course: old_dates})
+            if diff < 0:
+                change += diff
+            else:
+                s.courses_dict[course] = old_dates
+        return change
+
+    def _perturbed(self, s: State) -> State:
+        """
+        Returns a copy of s with WARM_PERTURB random date changes.
+        """
+        copy = State(dict(s.courses_dict))
+        for _ in range(WARM_PERTURB):
+            self._change_date(copy)
+        return copy
+
     def _mutate(self, s: State):
         """
         With some low probability create a small random change in the solution.
@@ -85,23 +562,24 @@ class GeneticSolver(Solver):
         :return: s after mutation.
         """
         if np.random.choice([True, False], p=[self.__p_mutate, 1 - self.__p_mutate]):
-            course = np.random.choice(list(s.courses_dict.keys()))
-            exam_dates = list(s.courses_dict[course])
-
-            moed_to_change = np.random.choice([0, 1])
-            moed_to_keep_date = exam_dates[1 - moed_to_change]
-            new_possible_dates = []
-
-            for d in [self.moed_a_dates, self.moed_b_dates][moed_to_change]:
-                if abs((d - moed_to_keep_date)).days >= MIN_DAYS_FROM_A_TO_B:
-                    new_possible_dates.append(d)
-
-            exam_dates[moed_to_change] = np.random.choice(new_possible_dates)
-            s.courses_dict[course] = tuple(exam_dates)
+            self._change_date(s)
         return s
 
-    def _update_prog_func(self, progress_func, iter_i, num_iterations):
-        progress = (iter_i / num_iterations) * 0.5
-        if GeneticSolver.NUM_CALLS % 2 == 0:
-            progress += 0.5
-        progress_func(progress)
+    def _change_date(self, s: State) -> Tuple[Course, Tuple[date, date]]:
+        """
+        Move one of the exams of a random course of the problem in s to a random date at least MIN_DAYS_FROM_A_TO_B
+        days from its other exam, moed b last. The course and the date are drawn in O(1), the date from the
+        calendar's admissible range (see ExamCalendar.admissible). The course stays in place if there is no such date.
+        :return: The course and its dates before the change.
+        """
+        course = self.course_list[random.randrange(len(self.course_list))]
+        old_dates = s.courses_dict[course]
+
+        moed_to_change = np.random.choice([0, 1])
+        start, stop = self.calendar.admissible(moed_to_change, old_dates[1 - moed_to_change])
+        if start == stop:
+            return course, old_dates
+        exam_dates = list(old_dates)
+        exam_dates[moed_to_change] = self.calendar.get_dates(moed_to_change)[np.random.randint(start, stop)]
+        s.courses_dict[course] = tuple(exam_dates)
+        return course, old_dates
@@ -5,6 +5,9 @@ from state import *
 from genetic_solver import GeneticSolver
 from StateLoader import StateLoader
 import matplotlib.pyplot as plt
+import numpy as np
+import random
+import time
 
 
 def func(prog):
@@ -61,11 +64,32 @@ def p_muted_changes(e, dl):
     plt.show()
 
 
+def parallel_changes(e, dl):
+    """
+    Compare the time of a run when evaluating the population serially and in worker processes.
+    """
+    workers = [None, 1, 2, 4, 8]
+    times = []
+
+    for w in workers:
+        random.seed(0)  # the initial population is drawn with random, the generations with np.random
+        np.random.seed(0)
+        solver = GeneticSolver(dl, e, initial_population=2000, workers=w)
+        start = time.perf_counter()
+        solver.solve(func, 10)
+        times.append(time.perf_counter() - start)
+        print("workers " + str(w) + ":  " + str(times[-1]) + " sec,  speedup: " + str(times[0] / times[-1]))
+    plt.plot([str(w) for w in workers], [times[0] / t for t in times], 'm')
+    plt.xlabel('Worker Processes')
+    plt.ylabel('Speedup')
+    plt.show()
+
+
 def main():
     dl = CSVdataloader("data/data2.csv", "data/courses_names_A.csv", date(2021, 1, 16), date(2021, 2, 11),
                        date(2021, 2, 13),
                        date(2021, 3, 4), [], YearSemester.SEM_A)
-    evaluator = SumEvaluator(dl.get_course_pair_weights())
+    evaluator = SumEvaluator(dl.get_course_pair_weights(), dl.get_conflict_graph())
 
     solver = GeneticSolver(dl, evaluator)
 
@@ -75,6 +99,8 @@ def main():
 
     p_muted_changes(evaluator, dl)
 
+    parallel_changes(evaluator, dl)
+
 
 if __name__ == "__main__":
     main()
@@ -18,7 +18,8 @@ from ttkwidgets import CheckboxTreeview
 from CSVdataloader import CSVdataloader
 from agenda_cal import Agenda
 from dataloader import No21DaysOfMoedBException
-from scheduler import run_solver, GENETIC_SOL, SA_SOL
+from scheduler import run_solver, GENETIC_SOL, SA_SOL, TABU_SOL
+from progress import ProgressChannel, PROGRESS_EVENT, DONE_EVENT
 from genetic_solver import GeneticSolver
 from objects import YearSemester, Major, MajorSemester
 from state import SumEvaluator, State
@@ -44,7 +45,9 @@ HEADER1_FONT = ("Courier New", 18, 'bold')
 BODY_FONT = ("Courier New", 12)
 BG = 'white'
 
-SOLVER_NAMES = {"Genetic Algorithm": GENETIC_SOL, "Simulated Annealing": SA_SOL}
+SOLVER_NAMES = {"Genetic Algorithm": GENETIC_SOL, "Simulated Annealing": SA_SOL, "Tabu Search": TABU_SOL}
+
+PROGRESS_POLL_MS = 100  # how often the GUI drains the solver's progress channel
 
 
 class WidgetWithLabel(Frame):
@@ -258,7 +261,7 @@ class ExamSchedulerGui:
         self.sem_b_b_end_entry.pack(expand=True, fill=tk.X, pady=5, padx=5)
 
         self.__choose_solver = WidgetWithLabel(dates_frame, "Solver Algorithm")
-        self.__choose_solver.set_widget(ttk.Combobox, values=["Genetic Algorithm", "Simulated Annealing"])
+        self.__choose_solver.set_widget(ttk.Combobox, values=list(SOLVER_NAMES))
         self.__choose_solver.widget.current(0)
         self.__choose_solver.pack(expand=True, fill=tk.X, pady=5, padx=5)
 
@@ -276,41 +279,55 @@ class ExamSchedulerGui:
     def run_solution(self):
         self.__solve_button.configure(state=tk.DISABLED)
         pb = ttk.Progressbar(self.__prog_bar_frame, length=100, mode='determinate', orient='horizontal')
+        channel = ProgressChannel()
 
-        def update(current_progress):
-            pb['value'] = current_progress * 100
-            self.root.update()
-
-        def run():
+        # runs in the solver thread, never touches tk - progress, the solutions and errors go through the channel
+        def run(*args, **kwargs):
             try:
-                kwargs = dict()
-                iterations = int(self.__choose_iterations.widget.get())
-                if iterations:
-                    kwargs['iterations'] = iterations
-                sol_a, sol_b = run_solver(self.maj_file_input.widget.get_selected_filename(),
-                                          self.sem_a_courses_file_input.widget.get_selected_filename(),
-                                          self.sem_b_courses_file_input.widget.get_selected_filename(),
-                                          self.sem_a_start_entry.widget.get_date(),
-                                          self.sem_a_a_end_entry.widget.get_date(),
-                                          self.sem_a_b_start_entry.widget.get_date(),
-                                          self.sem_a_b_end_entry.widget.get_date(),
-                                          self.sem_b_start_entry.widget.get_date(),
-                                          self.sem_b_a_end_entry.widget.get_date(),
-                                          self.sem_b_b_start_entry.widget.get_date(),
-                                          self.sem_b_b_end_entry.widget.get_date(),
-                                          self.__forbidden_dates,
-                                          SOLVER_NAMES[self.__choose_solver.widget.get()], update, **kwargs)
-                pb.destroy()
-                self.__solve_button.configure(state=tk.NORMAL)
-                self.show_solutions(sol_a, sol_b)
-            except No21DaysOfMoedBException:
-                showerror("Error!", "Selected dates do not include 21 days between the end of 1st round "
-                                    "and the end of 2nd round. Please retry with different dates.")
+                channel.done(run_solver(*args, **kwargs))
+            except Exception as e:
+                channel.error(e)
+
+        # runs in the main thread, every PROGRESS_POLL_MS until the solver is done
+        def poll():
+            for event, value in channel.drain():
+                if event == PROGRESS_EVENT:
+                    pb['value'] = value * 100
+                    continue
                 pb.destroy()
                 self.__solve_button.configure(state=tk.NORMAL)
+                if event == DONE_EVENT:
+                    self.show_solutions(*value)
+                elif isinstance(value, No21DaysOfMoedBException):
+                    showerror("Error!", "Selected dates do not include 21 days between the end of 1st round "
+                                        "and the end of 2nd round. Please retry with different dates.")
+                else:
+                    showerror("Error!", f"The solver failed: {value}")
+                return
+            self.root.after(PROGRESS_POLL_MS, poll)
+
+        kwargs = dict()
+        iterations = int(self.__choose_iterations.widget.get())
+        if iterations:
+            kwargs['iterations'] = iterations
+        args = (self.maj_file_input.widget.get_selected_filename(),
+                self.sem_a_courses_file_input.widget.get_selected_filename(),
+                self.sem_b_courses_file_input.widget.get_selected_filename(),
+                self.sem_a_start_entry.widget.get_date(),
+                self.sem_a_a_end_entry.widget.get_date(),
+                self.sem_a_b_start_entry.widget.get_date(),
+                self.sem_a_b_end_entry.widget.get_date(),
+                self.sem_b_start_entry.widget.get_date(),
+                self.sem_b_a_end_entry.widget.get_date(),
+                self.sem_b_b_start_entry.widget.get_date(),
+                self.sem_b_b_end_entry.widget.get_date(),
+                list(self.__forbidden_dates),
+                SOLVER_NAMES[self.__choose_solver.widget.get()], channel)
 
         pb.pack(fill=tk.BOTH, expand=True)
-        self.__solver_thread = threading.Thread(target=run).start()
+        self.__solver_thread = threading.Thread(target=run, args=args, kwargs=kwargs, daemon=True)
+        self.__solver_thread.start()
+        self.root.after(PROGRESS_POLL_MS, poll)
 
     def __show_solution(self, sol, tag):
         self.agenda.calevent_remove(tag=tag)
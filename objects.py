@@ -104,6 +104,11 @@ class Major:
     def __hash__(self):
         return hash(self.major_name)
 
+    def __reduce__(self):
+        # majors and courses refer to each other through dictionaries, so when unpickling, the name must be set
+        # before the object is used as a key
+        return Major, (self.major_name,), self.__dict__
+
     def __repr__(self):
         return str(self.major_name)
 
@@ -151,5 +156,8 @@ class Course:
     def __hash__(self):
         return self.__hash
 
+    def __reduce__(self):
+        return Course, (self.number, self.name), self.__dict__
+
     def __repr__(self):
         return self.number
@@ -0,0 +1,80 @@
+from math import exp
+from typing import List
+
+import numpy as np
+
+INVERSE = "inverse"
+TRUNCATED = "truncated"
+EXPONENTIAL = "exponential"
+
+DEFAULT_MAX_DAYS = 366
+
+
+class PenaltyKernel:
+    """
+    Penalty of the two exams of a colliding pair of courses, as a function of the number of days between them,
+    precomputed into a table indexed by the (absolute) day difference. Shapes:
+        INVERSE - 1 / (days + offset), the penalty of SumEvaluator
+        TRUNCATED - 1 / (days + offset) up to cutoff days, 0 after
+        EXPONENTIAL - exp(-days / scale)
+    The table grows on demand when a longer difference is asked for.
+    """
+
+    def __init__(self, shape: str = INVERSE, offset: float = 0.1, cutoff: int = None, scale: float = 1.0,
+                 max_days: int = DEFAULT_MAX_DAYS):
+        """
+        :param shape: One of INVERSE, TRUNCATED and EXPONENTIAL. default: INVERSE
+        :param offset: Added to the days of INVERSE and TRUNCATED, so a collision on the same day is finite.
+        :param cutoff: Last day difference that is penalized by TRUNCATED.
+        :param scale: Days over which EXPONENTIAL drops by a factor of e.
+        :param max_days: Longest day difference to precompute.
+        """
+        if shape not in (INVERSE, TRUNCATED, EXPONENTIAL):
+            raise ValueError(f"Unknown kernel shape {shape}")
+        if shape == TRUNCATED and cutoff is None:
+            raise ValueError("A truncated kernel needs a cutoff")
+        self.shape = shape
+        self.offset = offset
+        self.cutoff = cutoff
+        self.scale = scale
+        self.table: List[float] = []
+        self._array = None
+        self.get_table(max_days)
+
+    def penalty(self, days: int) -> float:
+        """
+        Computes the penalty of a day difference, without the table.
+        """
+        days = abs(days)
+        if self.shape == EXPONENTIAL:
+            return exp(-days / self.scale)
+        if self.shape == TRUNCATED and days > self.cutoff:
+            return 0.0
+        return 1 / (days + self.offset)
+
+    def get_table(self, max_days: int) -> List[float]:
+        """
+        Returns the table, after making sure it holds every difference up to max_days.
+        """
+        if max_days >= len(self.table):
+            self.table.extend(self.penalty(days) for days in range(len(self.table), max_days + 1))
+            self._array = None
+        return self.table
+
+    def get_array(self, max_days: int) -> np.ndarray:
+        """
+        Returns the table as a numpy array, for fancy indexing with arrays of day differences up to max_days.
+        """
+        self.get_table(max_days)
+        if self._array is None:
+            self._array = np.array(self.table)
+        return self._array
+
+    def __getitem__(self, days: int) -> float:
+        days = abs(days)
+        if days >= len(self.table):
+            self.get_table(days)
+        return self.table[days]
+
+
+DEFAULT_KERNEL = PenaltyKernel()
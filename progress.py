@@ -0,0 +1,127 @@
+import multiprocessing
+import queue
+import time
+from contextlib import contextmanager
+from queue import Empty, Full
+from typing import Callable, Sequence, List, Tuple, Any
+from concurrent.futures import Future, ProcessPoolExecutor
+
+PROGRESS_STEP = 0.01  # smallest change in progress a worker process reports
+PROGRESS_POLL_SEC = 0.1
+CHANNEL_SIZE = 64  # events a ProgressChannel holds before it drops progress events
+CHANNEL_MIN_INTERVAL_SEC = 0.05  # a ProgressChannel passes at most one progress event per this many seconds
+
+PROGRESS_EVENT = "progress"
+DONE_EVENT = "done"
+ERROR_EVENT = "error"
+
+
+class QueueProgress:
+    """
+    Progress function of a task that runs in another process. Puts (task index, progress) on a queue, only when the
+    progress moved by at least PROGRESS_STEP since the last report.
+    """
+
+    def __init__(self, queue, task_index: int):
+        self.queue = queue
+        self.task_index = task_index
+        self.last = -1
+
+    def __call__(self, progress: float):
+        if progress - self.last >= PROGRESS_STEP:
+            self.last = progress
+            self.queue.put((self.task_index, progress))
+
+
+def wait_with_progress(futures: Sequence[Future], queue, progress_func: Callable):
+    """
+    Wait for tasks that report through QueueProgress, calling progress_func from this thread with the mean progress
+    of all tasks.
+    """
+    progress = [0] * len(futures)
+    while not all(future.done() for future in futures):
+        try:
+            task_index, task_progress = queue.get(timeout=PROGRESS_POLL_SEC)
+        except Empty:
+            continue
+        progress[task_index] = task_progress
+        progress_func(sum(progress) / len(progress))
+
+
+# Context of a spawn_pool worker process, set once by set_worker_context when the pool starts.
+_worker_context = None
+
+
+def set_worker_context(context: Any):
+    global _worker_context
+    _worker_context = context
+
+
+def worker_context() -> Any:
+    """
+    The context the spawn_pool that started this worker process was given.
+    """
+    return _worker_context
+
+
+def spawn_pool(workers: int, context: Any = None) -> ProcessPoolExecutor:
+    """
+    Pool of worker processes, started with spawn since forking a process that runs the GUI's threads is not safe.
+    context (a solver, a problem instance, ...) is sent to each worker once, when the pool starts, and the tasks read
+    it with worker_context instead of receiving it with every task.
+    """
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                               initializer=set_worker_context, initargs=(context,))
+
+
+@contextmanager
+def spawn_pool_with_progress(workers: int, context: Any = None):
+    """
+    spawn_pool, with a managed queue for its tasks to report their progress on with QueueProgress and for
+    wait_with_progress to read. Yields the pool, the progress queue and the manager, for any other queue the tasks
+    share.
+    """
+    with multiprocessing.get_context("spawn").Manager() as manager, spawn_pool(workers, context) as pool:
+        yield pool, manager.Queue(), manager
+
+
+class ProgressChannel:
+    """
+    Thread safe channel of events from a solver running in a worker thread to a GUI, which drains it from its own
+    thread (with tkinter, from a root.after poll). Use the channel itself as the solver's progress function: progress
+    events are passed at most once per min_interval seconds and dropped when the channel is full, so a fast solver
+    never waits for the GUI. The result or the error of the run are always delivered.
+    Events are (PROGRESS_EVENT, progress), (DONE_EVENT, result) and (ERROR_EVENT, exception).
+    """
+
+    def __init__(self, maxsize: int = CHANNEL_SIZE, min_interval: float = CHANNEL_MIN_INTERVAL_SEC):
+        self._queue = queue.Queue(maxsize)
+        self.min_interval = min_interval
+        self._last_put = None
+
+    def __call__(self, progress: float):
+        now = time.monotonic()
+        if self._last_put is not None and now - self._last_put < self.min_interval:
+            return
+        try:
+            self._queue.put_nowait((PROGRESS_EVENT, progress))
+            self._last_put = now
+        except Full:
+            pass
+
+    def done(self, result: Any):
+        self._queue.put((DONE_EVENT, result))
+
+    def error(self, exception: BaseException):
+        self._queue.put((ERROR_EVENT, exception))
+
+    def drain(self) -> List[Tuple[str, Any]]:
+        """
+        Returns every event in the channel, without waiting.
+        """
+        events = []
+        while True:
+            try:
+                events.append(self._queue.get_nowait())
+            except Empty:
+                return events
@@ -0,0 +1,73 @@
+import random
+from typing import List, Sequence
+
+
+class FenwickSampler:
+    """
+    Draws indices with probability proportional to their weights, where weights change often. Weights are kept in
+    a Fenwick (binary indexed) tree, so both changing a weight and drawing an index cost O(log n).
+    """
+
+    def __init__(self, weights: Sequence[float]):
+        self.weights: List[float] = [0.0] * len(weights)
+        self._tree: List[float] = [0.0] * (len(weights) + 1)
+        self._top = 1
+        while self._top * 2 <= len(weights):
+            self._top *= 2
+        for i, weight in enumerate(weights):
+            self.set(i, weight)
+
+    def set(self, i: int, weight: float):
+        """
+        Set the weight of index i. Negative weights are taken as 0.
+        """
+        weight = max(weight, 0.0)
+        diff = weight - self.weights[i]
+        self.weights[i] = weight
+        i += 1
+        while i < len(self._tree):
+            self._tree[i] += diff
+            i += i & -i
+
+    def add(self, i: int, diff: float):
+        self.set(i, self.weights[i] + diff)
+
+    def total(self) -> float:
+        total, i = 0.0, len(self.weights)
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def sample(self) -> int:
+        """
+        Draw an index with probability weight / total, or uniformly if all weights are 0.
+        """
+        total = self.total()
+        if total <= 0:
+            return random.randrange(len(self.weights))
+        target = random.uniform(0, total)
+        pos, step = 0, self._top
+        while step:
+            if pos + step < len(self._tree) and self._tree[pos + step] < target:
+                pos += step
+                target -= self._tree[pos]
+            step //= 2
+        return min(pos, len(self.weights) - 1)
+
+    def sample_distinct(self, k: int) -> List[int]:
+        """
+        Draw k different indices, each with probability proportional to its weight among the ones not drawn yet.
+        """
+        drawn: List[int] = []
+        removed = []
+        for _ in range(min(k, len(self.weights))):
+            i = self.sample()
+            if i in drawn:  # only when all remaining weights are 0
+                i = random.choice([j for j in range(len(self.weights)) if j not in drawn])
+            drawn.append(i)
+            removed.append(self.weights[i])
+            self.set(i, 0.0)
+        for i, weight in zip(drawn, removed):
+            self.set(i, weight)
+        return drawn
@@ -1,52 +1,126 @@
+import os
+import time
+import warnings
 
+from checkpoint import CheckpointMismatch
 from CSVdataloader import CSVdataloader
 from solver import Solver
 from datetime import date
 from state import *
 from genetic_solver import GeneticSolver
 from SAsolver import SAsolver
+from tabu_solver import TabuSolver, TABU_ITERATIONS
+from progress import QueueProgress, wait_with_progress, spawn_pool_with_progress
+from StateLoader import StateLoader
 
 GENETIC_SOL = "genetic"
 SA_SOL = "simulated_annealing"
+TABU_SOL = "tabu"
 
+SUM_EVAL = "sum"
+NUMPY_EVAL = "numpy"
+EVALUATORS = {SUM_EVAL: SumEvaluator, NUMPY_EVAL: NumpyEvaluator}
+
+DEFAULT_ITERATIONS = {GENETIC_SOL: 1000, SA_SOL: 3000, TABU_SOL: TABU_ITERATIONS}
 
-def run_solver(major_data_path: str, courses_A_data_path: str, courses_B_data_path: str,
-               sem_a_a_start, sem_a_a_end, sem_a_b_start, sem_a_b_end,
-               sem_b_a_start, sem_b_a_end, sem_b_b_start, sem_b_b_end,
-               forbidden_dates, solver_type, prog_call_back, iterations=None):
 
+def _solve_semester(progress_func, major_data_path: str, courses_data_path: str, a_start, a_end, b_start, b_end,
+                    forbidden_dates, sem: YearSemester, solver_type, iterations, evaluator_type,
+                    checkpoint_dir=None, warm_start=None, time_limit=None) -> State:
+    """
+    Load and solve the exams of a single semester. With a checkpoint_dir, the run is checkpointed to a file there and
+    resumed from it if a previous run did not finish. The file is removed once the semester is solved, and a file left
+    by a run with other settings is discarded with a warning.
+    A time_limit (seconds) counts the loading of the data too, the solver gets what is left of it.
+    warm_start is a schedule file to start the solver from, as read by StateLoader.
+    """
+    start = time.monotonic()
+    loader = CSVdataloader(major_data_path, courses_data_path, a_start, a_end, b_start, b_end, forbidden_dates, sem)
+    evaluator = EVALUATORS[evaluator_type](loader.get_course_pair_weights(), loader.get_conflict_graph())
+    checkpoint = os.path.join(checkpoint_dir, f"{solver_type}_{sem.name}.ckpt") if checkpoint_dir else None
+    initial_state = None
+    if warm_start:
+        initial_state = StateLoader(warm_start, loader.get_course_list(),
+                                    ((a_start, a_end), (b_start, b_end))).get_state()
+    if time_limit is not None:
+        time_limit = max(time_limit - (time.monotonic() - start), 0)
 
+    def solve():
+        if solver_type == GENETIC_SOL:
+            return GeneticSolver(loader, evaluator).solve(progress_func, iterations, checkpoint=checkpoint, resume=True,
+                                                          time_limit=time_limit, initial_state=initial_state)
+        if solver_type == SA_SOL:
+            return SAsolver(loader, evaluator, ((a_start, a_end), (b_start, b_end))).solve(
+                progress_func, iterations=iterations, checkpoint=checkpoint, resume=True, time_limit=time_limit,
+                initial_state=initial_state)
+        if solver_type == TABU_SOL:  # deterministic and fast, not checkpointed
+            return TabuSolver(loader, evaluator).solve(progress_func, iterations, time_limit=time_limit,
+                                                       initial_state=initial_state)
+        raise NotImplementedError(solver_type)
 
-    loader_A = CSVdataloader(major_data_path, courses_A_data_path,
-                             sem_a_a_start, sem_a_a_end, sem_a_b_start, sem_a_b_end, forbidden_dates,
-                             YearSemester.SEM_A)
-    loader_B = CSVdataloader(major_data_path, courses_B_data_path,
-                             sem_b_a_start, sem_b_a_end, sem_b_b_start, sem_b_b_end, forbidden_dates,
-                             YearSemester.SEM_B)
+    try:
+        solution = solve()
+    except CheckpointMismatch as e:  # left by an unfinished run with other settings, start over
+        warnings.warn(f"{e} - discarding it")
+        os.remove(checkpoint)
+        solution = solve()
+    if checkpoint and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    return solution
 
-    evaluator_A = SumEvaluator(loader_A.get_course_pair_weights())
-    evaluator_B = SumEvaluator(loader_B.get_course_pair_weights())
 
-    if solver_type == GENETIC_SOL:
-        if not iterations:
-            iterations = 1000
-        gen_solver_A = GeneticSolver(loader_A, evaluator_A)
-        gen_solver_B = GeneticSolver(loader_B, evaluator_B)
-        sol_state_A = gen_solver_A.solve(prog_call_back, iterations)
-        sol_state_B = gen_solver_B.solve(prog_call_back, iterations)
+def _solve_semester_in_process(queue, sem_index: int, *args, end_time=None) -> State:
+    """
+    Entry point of a semester's worker process, reports progress through the queue. end_time is the wall-clock time
+    (time.time) the semester must be solved by, so the start up of the process counts against the time limit.
+    """
+    time_limit = max(end_time - time.time(), 0) if end_time is not None else None
+    return _solve_semester(QueueProgress(queue, sem_index), *args, time_limit=time_limit)
 
 
-    if solver_type == SA_SOL:
-        if not iterations:
-            iterations = 3000
-        sa_solver_A = SAsolver(loader_A, evaluator_A, ((sem_a_a_start, sem_a_a_end),
-                                                                           (sem_a_b_start, sem_a_b_end)))
-        sa_solver_B = SAsolver(loader_B, evaluator_B, ((sem_b_a_start, sem_b_a_end),
-                                                                           (sem_b_b_start, sem_b_b_end)))
-        sol_state_A = sa_solver_A.solve(lambda x: prog_call_back(x/2), iterations=iterations)
-        sol_state_B = sa_solver_B.solve(lambda x: prog_call_back((x+1)/2), iterations=iterations)
+def run_solver(major_data_path: str, courses_A_data_path: str, courses_B_data_path: str,
+               sem_a_a_start, sem_a_a_end, sem_a_b_start, sem_a_b_end,
+               sem_b_a_start, sem_b_a_end, sem_b_b_start, sem_b_b_end,
+               forbidden_dates, solver_type, prog_call_back, iterations=None, evaluator_type=SUM_EVAL,
+               concurrent=True, checkpoint_dir=None, time_limit=None, warm_start_A=None, warm_start_B=None):
+    """
+    Solve the exams of both semesters.
+    :param prog_call_back: Called with the overall progress (0 to 1), from the calling thread.
+    :param concurrent: Solve semester A and semester B at the same time, each in its own process. If False, the
+    semesters are solved one after the other in this process. default: True
+    :param checkpoint_dir: Directory to checkpoint the runs of both semesters to. A run that was stopped before it
+    finished (a crash, the GUI closed) continues from its checkpoint the next time it is started with the same
+    iterations. A checkpoint of a run with other settings is discarded with a warning. default: no checkpoints
+    :param time_limit: Wall-clock budget in seconds. Every solver returns the best schedule it found when its share
+    runs out, the iterations are then only the SA's first estimate. Concurrent semesters get the whole budget each,
+    sequential ones split it: semester A gets half and semester B whatever A left. default: no limit
+    :param warm_start_A: Schedule file of semester A to start from instead of a random schedule, such as last year's
+    schedule or an earlier solution. Courses missing from it are placed greedily. default: None
+    :param warm_start_B: Schedule file of semester B to start from. default: None
+    :return: Tuple of the solution states of semester A and semester B.
+    """
+    end_time = time.time() + time_limit if time_limit is not None else None
+    if solver_type not in DEFAULT_ITERATIONS:
+        raise NotImplementedError(solver_type)
+    if not iterations:
+        iterations = DEFAULT_ITERATIONS[solver_type]
+
+    args_A = (major_data_path, courses_A_data_path, sem_a_a_start, sem_a_a_end, sem_a_b_start, sem_a_b_end,
+              forbidden_dates, YearSemester.SEM_A, solver_type, iterations, evaluator_type, checkpoint_dir,
+              warm_start_A)
+    args_B = (major_data_path, courses_B_data_path, sem_b_a_start, sem_b_a_end, sem_b_b_start, sem_b_b_end,
+              forbidden_dates, YearSemester.SEM_B, solver_type, iterations, evaluator_type, checkpoint_dir,
+              warm_start_B)
 
-    else:
-        raise NotImplemented
+    if not concurrent:
+        solution_A = _solve_semester(lambda x: prog_call_back(x / 2), *args_A,
+                                     time_limit=time_limit / 2 if time_limit is not None else None)
+        if time_limit is not None:
+            time_limit = max(end_time - time.time(), 0)
+        return solution_A, _solve_semester(lambda x: prog_call_back((x + 1) / 2), *args_B, time_limit=time_limit)
 
-    return sol_state_A, sol_state_B
+    with spawn_pool_with_progress(2) as (pool, queue, _):
+        futures = [pool.submit(_solve_semester_in_process, queue, 0, *args_A, end_time=end_time),
+                   pool.submit(_solve_semester_in_process, queue, 1, *args_B, end_time=end_time)]
+        wait_with_progress(futures, queue, prog_call_back)
+        return futures[0].result(), futures[1].result()
@@ -1,10 +1,38 @@
+import time
 from abc import abstractmethod
 from datetime import date
-from typing import Iterable, Mapping, Callable
+from typing import Iterable, Mapping, Callable, Dict, Tuple
 
 from dataloader import Dataloader
 from objects import *
-from state import Evaluator
+from penalty_kernel import DEFAULT_KERNEL
+from state import Evaluator, State
+
+
+class Deadline:
+    """
+    Wall-clock budget of a solve call, counted from the moment the deadline is created. A deadline without seconds
+    never expires.
+    """
+
+    def __init__(self, seconds: float = None):
+        self.seconds = seconds
+        self.start = time.perf_counter()
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def remaining(self) -> float:
+        return max(self.seconds - self.elapsed(), 0.0) if self.seconds is not None else float("inf")
+
+    def expired(self) -> bool:
+        return self.seconds is not None and self.elapsed() >= self.seconds
+
+    def fraction(self) -> float:
+        """
+        Share of the budget used so far, between 0 and 1.
+        """
+        return min(self.elapsed() / self.seconds, 1.0) if self.seconds else 0.0
 
 
 class Solver:
@@ -18,8 +46,45 @@ class Solver:
         self.course_list = loader.get_course_list()
         self.course_pair_evaluator = loader.get_course_pair_weights()
         self.moed_a_dates, self.moed_b_dates = loader.get_available_dates()
+        self.conflict_graph = loader.get_conflict_graph()
+        self.calendar = loader.get_exam_calendar()
         self.evaluator = evaluator
 
+    def complete_state(self, state: State) -> State:
+        """
+        Turn a partial schedule (for example last year's schedule, loaded by StateLoader) into a full one.
+        The dates of the state are kept for every course of this problem that it schedules on available dates at
+        least MIN_DAYS_FROM_A_TO_B apart. Every other course is placed greedily, the most conflicted first, on the
+        pair of dates with the least penalty against the courses placed so far.
+        :return: A new state with the courses in course_list order.
+        """
+        graph = self.conflict_graph
+        kernel = getattr(self.evaluator, "kernel", DEFAULT_KERNEL)
+        available = set(self.moed_a_dates), set(self.moed_b_dates)
+        placed: Dict[Course, Tuple[date, date]] = dict()
+        for course, (date_a, date_b) in state.courses_dict.items():
+            if course in graph and date_a in available[0] and date_b in available[1] and \
+                    (date_b - date_a).days >= MIN_DAYS_FROM_A_TO_B:
+                placed[course] = date_a, date_b
+
+        def conflict(course: Course) -> float:
+            return sum(weight for _, weight in graph.neighbours(graph.index[course]))
+
+        for course in sorted((c for c in self.course_list if c not in placed), key=conflict, reverse=True):
+            # the penalty of a pair of dates is the sum of the penalties of its moed a date and its moed b date
+            costs = [{d: 0.0 for d in self.moed_a_dates}, {d: 0.0 for d in self.moed_b_dates}]
+            for j, weight in graph.neighbours(graph.index[course]):
+                other = graph.courses[j]
+                if other in placed:
+                    for moed in (0, 1):
+                        other_day = placed[other][moed].toordinal()
+                        for d in costs[moed]:
+                            costs[moed][d] += weight * kernel[d.toordinal() - other_day]
+            pairs = [(a, b) for a in self.moed_a_dates for b in self.moed_b_dates
+                     if (b - a).days >= MIN_DAYS_FROM_A_TO_B]
+            placed[course] = min(pairs, key=lambda pair: costs[0][pair[0]] + costs[1][pair[1]])
+        return State({course: placed[course] for course in self.course_list})
+
     @abstractmethod
     def solve(self, progress_func: Callable):
         """
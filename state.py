@@ -1,10 +1,15 @@
 import random
 from abc import abstractmethod
+from array import array
 from datetime import date, timedelta
 from typing import Dict, List, Tuple, Iterable, Sequence, Mapping, Set
 import csv
+import numpy as np
 
 from objects import *
+from conflict_graph import ConflictGraph
+from exam_calendar import ExamCalendar, get_calendar
+from penalty_kernel import PenaltyKernel, DEFAULT_KERNEL
 
 
 class State:
@@ -21,8 +26,10 @@ class State:
         default: None
         :param date_list: Tuple of Sequences of available dates for moed a and moed b. Must not be None if
         courses_and_dates is None. default: None
+        :param keep_empty: Keep an empty courses_and_dates (or no courses at all, given a course_list) as it is,
+        instead of random initialising the state. default: False
         """
-        assert course_list or courses_and_dates
+        assert course_list or courses_and_dates or (keep_empty and courses_and_dates is not None)
         self.course_list = course_list
         self.date_list = date_list
         self.courses_dict: Dict[Course, Tuple[date, date]] = courses_and_dates
@@ -30,17 +37,19 @@ class State:
             self.random_initialise()
 
     def random_initialise(self):
+        """
+        Give every course a random moed a date and a random moed b date at least MIN_DAYS_FROM_A_TO_B days after it,
+        drawn in O(1) from the admissible ranges of the problem's calendar.
+        """
         self.courses_dict = dict()
+        calendar = get_calendar(*self.date_list)
+        a_dates, b_dates = calendar.moed_a_dates, calendar.moed_b_dates
         for c in self.course_list:
-            a_date = random.choice(self.date_list[0])
-            possible_b_dates = []
-            for b_date in self.date_list[1]:
-                if (b_date - a_date).days >= MIN_DAYS_FROM_A_TO_B:
-                    possible_b_dates.append(b_date)
-            if not possible_b_dates:  # if no possible dates - an error may happen
-                print(a_date)
-            b_date = random.choice(possible_b_dates)
-            self.courses_dict[c] = a_date, b_date
+            a_date = a_dates[random.randrange(len(a_dates))]
+            start, stop = calendar.admissible(1, a_date)
+            if start == stop:
+                raise ValueError(f"No moed b date is {MIN_DAYS_FROM_A_TO_B} days after {a_date}")
+            self.courses_dict[c] = a_date, b_dates[random.randrange(start, stop)]
 
     def export_solution(self) -> Mapping[date, Iterable[Course]]:
         """
@@ -126,6 +135,75 @@ class State:
         return repr_str
 
 
+class ArrayState:
+    """
+    Compact state. The moed a and moed b dates of the courses are kept as calendar days (see ExamCalendar) in two
+    int16 arrays, indexed by the position of the course in a fixed course list shared by all states of a problem
+    (usually the conflict graph's courses), so copying a state is two small buffer copies.
+    The export functions of State are available through to_state.
+    """
+
+    __slots__ = ('courses', 'calendar', 'moed_a', 'moed_b')
+
+    def __init__(self, courses: Sequence[Course], calendar: ExamCalendar,
+                 moed_a: array = None, moed_b: array = None):
+        """
+        :param courses: Course list that gives every course its index. Shared, not copied.
+        :param calendar: Day numbering of the problem.
+        :param moed_a: moed a day of every course. default: all zero
+        :param moed_b: moed b day of every course. default: all zero
+        """
+        self.courses = courses
+        self.calendar = calendar
+        self.moed_a = moed_a if moed_a is not None else array('h', bytes(2 * len(courses)))
+        self.moed_b = moed_b if moed_b is not None else array('h', bytes(2 * len(courses)))
+
+    @staticmethod
+    def from_state(state: State, courses: Sequence[Course], calendar: ExamCalendar):
+        """
+        Create a compact copy of a state. The state must hold dates for all of the given courses. An ArrayState of
+        the same courses and day numbering is copied buffer to buffer.
+        """
+        if isinstance(state, ArrayState) and state.courses == courses and \
+                state.calendar.first_date == calendar.first_date:
+            return ArrayState(courses, calendar, array('h', state.moed_a), array('h', state.moed_b))
+        courses_dict = state.courses_dict  # built anew by every read of an ArrayState's
+        moed_a = array('h', [calendar.day_of(courses_dict[course][0]) for course in courses])
+        moed_b = array('h', [calendar.day_of(courses_dict[course][1]) for course in courses])
+        return ArrayState(courses, calendar, moed_a, moed_b)
+
+    def to_state(self) -> State:
+        return State(self.courses_dict)
+
+    def copy(self):
+        return ArrayState(self.courses, self.calendar, array('h', self.moed_a), array('h', self.moed_b))
+
+    def get_dates(self, i: int) -> Tuple[date, date]:
+        return self.calendar.date_of(self.moed_a[i]), self.calendar.date_of(self.moed_b[i])
+
+    def set_dates(self, i: int, dates: Tuple[date, date]):
+        self.moed_a[i], self.moed_b[i] = self.calendar.day_of(dates[0]), self.calendar.day_of(dates[1])
+
+    @property
+    def courses_dict(self) -> Dict[Course, Tuple[date, date]]:
+        """
+        The dates of the state as a new State.courses_dict style dictionary. Changing it does not change the state.
+        """
+        return {course: self.get_dates(i) for i, course in enumerate(self.courses)}
+
+    def export_solution(self) -> Mapping[date, Iterable[Course]]:
+        return self.to_state().export_solution()
+
+    def save_to_csv(self, file_path):
+        self.to_state().save_to_csv(file_path)
+
+    def get_major_schedule_repr(self, major: Major, year_sem: YearSemester):
+        return self.to_state().get_major_schedule_repr(major, year_sem)
+
+    def __repr__(self):
+        return repr(self.to_state())
+
+
 class Evaluator:
 
     def __init__(self, course_pair_evaluate):
@@ -138,36 +216,283 @@ class Evaluator:
     def __call__(self, state: State, *args, **kwargs) -> float:
         return self.evaluate(state)
 
+    def evaluate_population(self, states: Sequence[State]) -> List[float]:
+        """
+        Evaluate a whole population of states. Evaluators that can score many states at once should override it.
+        """
+        return [self.evaluate(state) for state in states]
+
+    def course_penalties(self, state: State) -> Dict[Course, float]:
+        """
+        Returns the share of every course in the penalty of the state. Only evaluators that sum a penalty over pairs
+        of courses can tell it.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not split its penalty between courses")
+
+    def delta(self, state: State, old_dates: Mapping[Course, Tuple[date, date]],
+              changes: Dict[Course, float] = None) -> float:
+        """
+        Returns the change in penalty caused by moving some of the courses of a state.
+        :param state: State that already holds the new dates of the moved courses.
+        :param old_dates: Mapping of each moved course to the dates it had before the move.
+        :param changes: If given, the change in course_penalties of every course the move affected is added to it.
+        :return: penalty(state) - penalty(state before the move).
+        The default implementation evaluates the state twice, evaluators should override it when they can do better.
+        """
+        if changes is not None:
+            raise NotImplementedError(f"{type(self).__name__} does not split its penalty between courses")
+        new_pen = self.evaluate(state)
+        new_dates = {course: state.courses_dict[course] for course in old_dates}
+        state.courses_dict.update(old_dates)
+        old_pen = self.evaluate(state)
+        state.courses_dict.update(new_dates)
+        return new_pen - old_pen
+
+
+def _max_days_apart(days: Sequence[Tuple[int, int]]) -> int:
+    """
+    Returns the largest difference between the days of a list of (moed a day, moed b day), where missing
+    entries are None.
+    """
+    present = [day for pair in days if pair is not None for day in pair]
+    return max(present) - min(present) if present else 0
+
 
 class SumEvaluator(Evaluator):
 
-    def __init__(self, course_pair_evaluate):
+    def __init__(self, course_pair_evaluate, conflict_graph: ConflictGraph = None, kernel: PenaltyKernel = None):
+        """
+        :param course_pair_evaluate: Weight function of a pair of courses.
+        :param conflict_graph: Sparse graph of the pairs with a non zero weight (see Dataloader.get_conflict_graph).
+        If None, it is built from course_pair_evaluate over the courses of the first state evaluated.
+        :param kernel: Penalty of a colliding pair by the days between their exams. default: DEFAULT_KERNEL,
+        1 / (days + 0.1)
+        """
         super().__init__(course_pair_evaluate)
+        self.conflict_graph = conflict_graph
+        self.kernel = kernel if kernel is not None else DEFAULT_KERNEL
 
     def evaluate(self, state: State) -> float:
 
         sum = 0
 
-        course_list = list(state.courses_dict.keys())
-
-        for i in range(len(course_list)):
-            for j in range(i + 1, len(course_list)):
-                course1, course2 = course_list[i], course_list[j]
-                course1_dateA, course1_dateB = state.courses_dict[course1]
-                course2_dateA, course2_dateB = state.courses_dict[course2]
-
-                time_A, time_B = abs((course1_dateA - course2_dateA).days) + 0.1, abs(
-                    (course1_dateB - course2_dateB).days) + 0.1
-
-                course_distance = self.course_pair_evalutor(course1, course2)
-                if course_distance == 0:
+        graph = self._get_graph(state, ())
+        courses_dict = state.courses_dict
+        days = [None] * len(graph)
+        found = 0
+        for i, course in enumerate(graph.courses):
+            if course in courses_dict:
+                date_a, date_b = courses_dict[course]
+                days[i] = date_a.toordinal(), date_b.toordinal()
+                found += 1
+        if not self._covers(state, found):
+            self._get_graph(state)
+            return self.evaluate(state)
+        kernel = self.kernel.get_table(_max_days_apart(days))
+
+        for i in range(len(graph)):
+            if days[i] is None:
+                continue
+            course1_dayA, course1_dayB = days[i]
+            for j, course_distance in graph.neighbours(i):
+                if j < i or days[j] is None:  # every pair is counted once
                     continue
-                else:
-                    sum += course_distance * (1 / time_A) + course_distance * (1 / time_B)
+                course2_dayA, course2_dayB = days[j]
+                sum += course_distance * (kernel[abs(course1_dayA - course2_dayA)] +
+                                          kernel[abs(course1_dayB - course2_dayB)])
         return sum
 
+    def course_penalties(self, state: State) -> Dict[Course, float]:
+        """
+        Returns the share of every course of the state in its penalty: the sum of the penalties of the pairs it is
+        part of. Every pair is counted for both of its courses, so the shares add up to twice the penalty.
+        """
+        graph = self._get_graph(state)
+        courses_dict = state.courses_dict
+        penalties = {course: 0.0 for course in courses_dict}
+        for course, (date_a, date_b) in courses_dict.items():
+            day_a, day_b = date_a.toordinal(), date_b.toordinal()
+            for j, weight in graph.neighbours(graph.index[course]):
+                other = graph.courses[j]
+                if other in courses_dict:
+                    other_a, other_b = courses_dict[other]
+                    penalties[course] += weight * (self.kernel[day_a - other_a.toordinal()] +
+                                                   self.kernel[day_b - other_b.toordinal()])
+        return penalties
+
+    def delta(self, state: State, old_dates: Mapping[Course, Tuple[date, date]],
+              changes: Dict[Course, float] = None) -> float:
+        """
+        Returns the exact change in penalty caused by moving the courses in old_dates, by going over the pairs that
+        contain a moved course only. Costs O(k * degree) for k moved courses instead of the O(edges) of evaluate.
+        :param state: State that already holds the new dates of the moved courses.
+        :param old_dates: Mapping of each moved course to the dates it had before the move.
+        :param changes: If given, the change in course_penalties of both courses of every pair that changed is
+        added to it.
+        """
+        graph = self._get_graph(state, old_dates)
+        courses_dict = state.courses_dict
+        kernel = self.kernel.table
+        diff = 0
+        course_changes = dict()
+        try:
+            for course, (old_a, old_b) in old_dates.items():
+                i = graph.index[course]
+                new_a, new_b = courses_dict[course]
+                new_a, new_b, old_a, old_b = new_a.toordinal(), new_b.toordinal(), old_a.toordinal(), old_b.toordinal()
+                for j, weight in graph.neighbours(i):
+                    other = graph.courses[j]
+                    if other not in courses_dict:
+                        continue
+                    other_new_a, other_new_b = courses_dict[other]
+                    other_new_a, other_new_b = other_new_a.toordinal(), other_new_b.toordinal()
+                    if other in old_dates:
+                        if j < i:  # pairs of two moved courses are counted once
+                            continue
+                        other_old_a, other_old_b = old_dates[other]
+                        other_old_a, other_old_b = other_old_a.toordinal(), other_old_b.toordinal()
+                    else:
+                        other_old_a, other_old_b = other_new_a, other_new_b
+
+                    # grouped so that a pair that did not change gives exactly 0
+                    pair_diff = weight * ((kernel[abs(new_a - other_new_a)] + kernel[abs(new_b - other_new_b)]) -
+                                          (kernel[abs(old_a - other_old_a)] + kernel[abs(old_b - other_old_b)]))
+                    diff += pair_diff
+                    if changes is not None and pair_diff:
+                        course_changes[course] = course_changes.get(course, 0) + pair_diff
+                        course_changes[other] = course_changes.get(other, 0) + pair_diff
+        except IndexError:  # dates further apart than the kernel's table, grow it and start over
+            all_dates = list(courses_dict.values()) + list(old_dates.values())
+            self.kernel.get_table(_max_days_apart([(a.toordinal(), b.toordinal()) for a, b in all_dates]))
+            return self.delta(state, old_dates, changes)
+
+        if changes is not None:
+            for course, change in course_changes.items():
+                changes[course] = changes.get(course, 0) + change
+        return diff
+
+    def _get_graph(self, state: State, courses: Iterable[Course] = None) -> ConflictGraph:
+        """
+        Returns the conflict graph, building it from the pair weights over the courses of the state if there is
+        none or if it does not include all of the given courses. default: all courses of the state
+        Checking all courses costs O(n) - delta checks the moved courses only, and evaluate and state_days check
+        none and count the courses of the state they find in the graph instead, see _covers.
+        """
+        if courses is None:
+            courses = state.courses_dict
+        if self.conflict_graph is None or any(course not in self.conflict_graph for course in courses):
+            self.conflict_graph = ConflictGraph.from_pair_weights(list(state.courses_dict.keys()),
+                                                                  self.course_pair_evalutor)
+        return self.conflict_graph
+
+    @staticmethod
+    def _covers(state: State, found: int) -> bool:
+        """
+        Returns True if the graph holds all courses of the state, given the number of its courses found in it.
+        """
+        return found == len(state.courses_dict)
+
+
+class NumpyEvaluator(SumEvaluator):
+    """
+    Computes the same penalty as SumEvaluator, vectorized: a state is turned into two vectors of day numbers (moed a
+    and moed b), and the penalty of all pairs of the conflict graph is computed in one numpy expression.
+    Incremental evaluation (delta) is inherited from SumEvaluator.
+    """
 
+    POPULATION_CHUNK = 256
 
+    def __init__(self, course_pair_evaluate, conflict_graph: ConflictGraph = None, kernel: PenaltyKernel = None):
+        super().__init__(course_pair_evaluate, conflict_graph, kernel)
+        self._edges_graph = None
+        self._rows, self._cols, self._weights = None, None, None
 
+    def evaluate(self, state: State) -> float:
+        days_a, days_b, present = self.state_days(state)
+        return float(self.evaluate_days(days_a, days_b, self._present_weights(present)))
 
+    def evaluate_population(self, states: Sequence[State]) -> List[float]:
+        """
+        Evaluate a whole population at once: the states are stacked into (population x courses) day matrices and
+        scored together, POPULATION_CHUNK states per numpy pass to bound the memory used.
+        """
+        if not states:
+            return []
+        days = [self.state_days(state) for state in states]
+        days_a = np.stack([d[0] for d in days])
+        days_b = np.stack([d[1] for d in days])
+        present = np.stack([d[2] for d in days])
+        penalties = []
+        for start in range(0, len(states), NumpyEvaluator.POPULATION_CHUNK):
+            chunk = slice(start, start + NumpyEvaluator.POPULATION_CHUNK)
+            penalties.extend(self.evaluate_days(days_a[chunk], days_b[chunk],
+                                                self._present_weights(present[chunk])).tolist())
+        return penalties
+
+    def state_days(self, state: State) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns the moed a and moed b day numbers of the courses of the state, ordered by the conflict graph's course
+        indices, and a mask of the courses that appear in the state. Array states over the graph's courses are read
+        straight from their buffers (calendar days), other states are numbered by date.toordinal.
+        """
+        if isinstance(state, ArrayState) and self.conflict_graph is not None and \
+                (state.courses is self.conflict_graph.courses or state.courses == self.conflict_graph.courses):
+            return np.frombuffer(state.moed_a, dtype=np.int16).astype(np.int64), \
+                   np.frombuffer(state.moed_b, dtype=np.int16).astype(np.int64), np.ones(len(state.courses), dtype=bool)
+
+        graph = self._get_graph(state, ())
+        days_a = np.zeros(len(graph), dtype=np.int64)
+        days_b = np.zeros(len(graph), dtype=np.int64)
+        present = np.ones(len(graph), dtype=bool)
+        for i, course in enumerate(graph.courses):
+            if course not in state.courses_dict:
+                present[i] = False
+                continue
+            date_a, date_b = state.courses_dict[course]
+            days_a[i], days_b[i] = date_a.toordinal(), date_b.toordinal()
+        if not self._covers(state, int(present.sum())):
+            self._get_graph(state)
+            return self.state_days(state)
+        return days_a, days_b, present
+
+    def evaluate_days(self, days_a: np.ndarray, days_b: np.ndarray, weights: np.ndarray = None):
+        """
+        Evaluate day numbers of all courses of the conflict graph. Days may be of any integer origin.
+        :param days_a: moed a day of every course, indexed by the course index in the conflict graph. Either a vector
+        for a single state or a (population x courses) matrix.
+        :param days_b: moed b day of every course, same shape as days_a.
+        :param weights: Weights of the edges to use instead of the graph's, per state for a matrix. default: None
+        :return: The penalty, or a vector of penalties for a matrix.
+        """
+        rows, cols, edge_weights = self._get_edges(self.conflict_graph)
+        if weights is None:
+            weights = edge_weights
+        time_a = np.abs(days_a[..., rows] - days_a[..., cols])
+        time_b = np.abs(days_b[..., rows] - days_b[..., cols])
+        kernel = self.kernel.get_array(int(max(time_a.max(initial=0), time_b.max(initial=0))))
+        return np.sum(weights * (kernel[time_a] + kernel[time_b]), axis=-1)
+
+    def _present_weights(self, present: np.ndarray):
+        """
+        Returns the edge weights where pairs with a course missing from the state are not counted, or None if all
+        courses are present. present may be a mask of a single state or a (population x courses) matrix.
+        """
+        if present.all():
+            return None
+        rows, cols, weights = self._get_edges(self.conflict_graph)
+        return weights * (present[..., rows] & present[..., cols])
 
+    def _get_edges(self, graph: ConflictGraph) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns the edges of the graph as arrays of (first course index, second course index, weight), each pair
+        once. Cached until the graph changes.
+        """
+        if self._edges_graph is not graph:
+            indptr = np.frombuffer(graph.indptr, dtype=graph.indptr.typecode)
+            rows = np.repeat(np.arange(len(graph)), np.diff(indptr))
+            cols = np.frombuffer(graph.indices, dtype=graph.indices.typecode).astype(np.int64)
+            weights = np.frombuffer(graph.weights, dtype=np.float64)
+            upper = rows < cols
+            self._rows, self._cols, self._weights = rows[upper], cols[upper], weights[upper]
+            self._edges_graph = graph
+        return self._rows, self._cols, self._weights
@@ -0,0 +1,180 @@
+import heapq
+from itertools import count
+from typing import Callable
+
+import numpy as np
+
+from solver import *
+from dataloader import Dataloader
+from penalty_kernel import DEFAULT_KERNEL
+from state import Evaluator, State
+
+TABU_ITERATIONS = 2000
+TABU_TENURE = 15  # steps an exam may not return to a date it was moved away from
+HEAP_SLACK = 4  # the move heap is rebuilt once it holds this many entries per row, most of them stale
+
+
+class TabuSolver(Solver):
+    """
+        Tabu search. Every step makes the best single exam move - one course's moed a or moed b to another available
+    date, keeping MIN_DAYS_FROM_A_TO_B days between them - that is not tabu, even if it makes the schedule worse. Moving
+    an exam away from a date makes moving it back there tabu for tenure steps, unless that reaches a new best penalty.
+        The cost of every possible move is read from a (courses x dates) table per moed, holding the penalty of the
+    course's pairs if its exam was on that date. A heap keys every row of a table by its best move, which bounds the
+    row's best allowed move from below, and a step pops rows until one's key is its best allowed move, so tabu and
+    aspiration are only checked on the popped rows. A row whose best moves are tabu goes back keyed by its best allowed
+    move until they may be made again. After a move only the rows of the moved course and of its neighbours change,
+    so a step costs O(degree * dates) instead of a full evaluation. This needs an evaluator that sums a day kernel over
+    the pairs of the conflict graph, as SumEvaluator and NumpyEvaluator do. There is no randomness: the same initial
+    state always gives the same result.
+    """
+
+    def __init__(self, loader: Dataloader, evaluator: Evaluator, tenure: int = TABU_TENURE):
+        """
+        :param tenure: Number of steps a move back to a date the exam was moved away from stays tabu.
+        """
+        super(TabuSolver, self).__init__(loader, evaluator)
+        self.tenure = tenure
+        self.penalty = None  # penalty of the state the last solve returned
+
+    def solve(self, progress_func: Callable, iterations=TABU_ITERATIONS, time_limit: float = None,
+              initial_state: State = None) -> State:
+        """
+            Run the search and return the best state it passed through.
+        :param iterations: Number of moves.
+        :param time_limit: If given, move until time_limit seconds pass instead of for the given number of moves.
+        :param initial_state: Schedule to start from, courses it is missing are filled in by complete_state.
+        default: the greedy schedule of complete_state
+        """
+        deadline = Deadline(time_limit)
+        graph, calendar = self.conflict_graph, self.calendar
+        kernel = getattr(self.evaluator, "kernel", DEFAULT_KERNEL).get_array(calendar.num_days)
+        if initial_state is None:
+            initial_state = State(dict(), course_list=self.course_list, keep_empty=True)
+        state = self.complete_state(initial_state)
+
+        n = len(graph.courses)
+        rows = np.arange(n)
+        indptr, indices = np.array(graph.indptr), np.array(graph.indices)
+        weights = np.array(graph.weights)
+        edge_rows = np.repeat(rows, np.diff(indptr))
+        isolated = np.diff(indptr) == 0  # moving a course without conflicts never changes the penalty
+        days = [np.array(calendar.get_days(moed)) for moed in (0, 1)]
+        current, cost = [], []
+        for moed in (0, 1):
+            day_index = {day: x for x, day in enumerate(days[moed])}
+            current.append(np.array([day_index[calendar.day_of(state.courses_dict[course][moed])]
+                                     for course in graph.courses]))
+            # cost[moed][i, x] - penalty of the pairs of course i in this moed, if its exam was on date x
+            table = np.zeros((n, len(days[moed])))
+            placed = days[moed][current[moed]][indices]
+            np.add.at(table, edge_rows, weights[:, None] * kernel[np.abs(days[moed][None, :] - placed[:, None])])
+            cost.append(table)
+
+        penalty = sum(cost[moed][rows, current[moed]].sum() for moed in (0, 1)) / 2
+
+        # the steps read and update single rows, which is cheaper on lists than on numpy arrays
+        cost = [table.tolist() for table in cost]
+        current = [c.tolist() for c in current]
+        tabu = [[[0] * len(days[moed]) for _ in range(n)] for moed in (0, 1)]  # step until which a move there is tabu
+        isolated = isolated.tolist()
+        # kernels[moed][x][y] - kernel of the days between dates x and y of moed
+        kernels = [kernel[np.abs(days[moed][:, None] - days[moed][None, :])].tolist() for moed in (0, 1)]
+        # admissible[moed][y] - index range of the dates of moed that keep the gap to date y of the other moed
+        admissible = [[calendar.admissible(moed, other) for other in calendar.get_dates(1 - moed)] for moed in (0, 1)]
+        best, best_pen = [c.copy() for c in current], penalty
+
+        # heap of (key, moed, course, version) entries, where key is a lower bound of the best allowed move of the
+        # course's row of moed. An entry is stale once its row has a newer version.
+        heap, key, version = [], [[np.inf] * n, [np.inf] * n], [[0] * n, [0] * n]
+        # a row whose best moves are tabu is keyed by its best allowed move, until its first tabu move expires (step
+        # -> rows in expiring) or its cheapest tabu move would reach a new best penalty (aspiring heap)
+        expiring, aspiring, aspire = {}, [], [[np.inf] * n, [np.inf] * n]
+
+        def push(moed: int, i: int):
+            # key the row by its best move, tabu or not
+            version[moed][i] += 1
+            key[moed][i] = aspire[moed][i] = np.inf
+            if isolated[i]:
+                return
+            row, x = cost[moed][i], current[moed][i]
+            start, stop = admissible[moed][current[1 - moed][i]]
+            others = row[start:x] + row[x + 1:stop] if start <= x < stop else row[start:stop]
+            key[moed][i] = min(others) - row[x] if others else np.inf
+            if key[moed][i] < np.inf:
+                heapq.heappush(heap, (key[moed][i], moed, i, version[moed][i]))
+
+        for moed in (0, 1):
+            for i in range(n):
+                push(moed, i)
+
+        for step in range(1, iterations + 1) if time_limit is None else count(1):
+            if deadline.expired():
+                break
+            progress_func(deadline.fraction() if time_limit is not None else step / iterations)
+
+            for moed, i, row_version in expiring.pop(step, ()):
+                if row_version == version[moed][i]:
+                    push(moed, i)
+            while aspiring and penalty + aspiring[0][0] < best_pen:
+                _, moed, i, row_version = heapq.heappop(aspiring)
+                if row_version == version[moed][i]:
+                    push(moed, i)
+
+            # best allowed move, ties broken by moed, course and date: the first row whose key is its best allowed move
+            move = None
+            while heap:
+                row_key, moed, i, row_version = heapq.heappop(heap)
+                if row_version != version[moed][i]:
+                    continue
+                row, row_tabu, x = cost[moed][i], tabu[moed][i], current[moed][i]
+                start, stop = admissible[moed][current[1 - moed][i]]
+                allowed, allowed_x, cheapest_tabu, first_expiry = np.inf, None, np.inf, None
+                for y in range(start, stop):
+                    if y == x:
+                        continue
+                    delta = row[y] - row[x]
+                    if row_tabu[y] >= step and penalty + delta >= best_pen:
+                        cheapest_tabu = min(cheapest_tabu, delta)
+                        first_expiry = row_tabu[y] if first_expiry is None else min(first_expiry, row_tabu[y])
+                    elif delta < allowed:
+                        allowed, allowed_x = delta, y
+                if allowed == row_key:
+                    move = allowed, moed, i, allowed_x
+                    break
+                key[moed][i], aspire[moed][i] = allowed, cheapest_tabu
+                if allowed < np.inf:
+                    heapq.heappush(heap, (allowed, moed, i, row_version))
+                expiring.setdefault(first_expiry + 1, []).append((moed, i, row_version))
+                heapq.heappush(aspiring, (cheapest_tabu, moed, i, row_version))
+            if move is None:  # every move is tabu
+                continue
+            diff, moed, i, x = move
+
+            old_x = current[moed][i]
+            tabu[moed][i][old_x] = step + self.tenure
+            current[moed][i] = x
+            penalty += diff
+            change = [new - old for new, old in zip(kernels[moed][x], kernels[moed][old_x])]
+            for j, weight in graph.neighbours(i):
+                row = cost[moed][j]
+                for y, c in enumerate(change):
+                    row[y] += weight * c
+                push(moed, j)
+            push(0, i)  # both rows of the moved course, its gap to the other moed changed too
+            push(1, i)
+            if len(heap) + len(aspiring) > HEAP_SLACK * 2 * n:
+                heap = [(key[m][j], m, j, version[m][j]) for m in (0, 1) for j in range(n) if key[m][j] < np.inf]
+                aspiring = [(aspire[m][j], m, j, version[m][j]) for m in (0, 1) for j in range(n)
+                            if aspire[m][j] < np.inf]
+                heapq.heapify(heap)
+                heapq.heapify(aspiring)
+
+            if penalty < best_pen:
+                best, best_pen = [c.copy() for c in current], penalty
+
+        dates = [calendar.get_dates(moed) for moed in (0, 1)]
+        best_dates = {course: (dates[0][best[0][j]], dates[1][best[1][j]]) for j, course in enumerate(graph.courses)}
+        solution = State({course: best_dates[course] for course in self.course_list})
+        self.penalty = self.evaluator(solution)
+        return solution